@@ -1,82 +1,247 @@
 import os
-from typing import Tuple
-from openai import OpenAI
+import re
+import asyncio
+import threading
+import contextvars
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from openai import OpenAI, AsyncOpenAI
 
 # Project level imports.
 from utils.searcher import EntitySearcher
-from utils.prompts import instruction_prompt
+from utils.prompt_builder import PromptBuilder
+from utils.llm import call_with_retry, acall_with_retry
+from utils.llm_cache import ResponseCache, CacheMiss
+from utils.lru_cache import normalize_query
+from utils import tracing
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# "Action 2: Search[x]", also as "action:search [x]" or "**Action 2:** Search[x]".
+ACTION = re.compile(r"Action\s*\d*\s*:\s*\**\s*(Search|Lookup|Finish)\s*\[(.*)\]", re.IGNORECASE)
+THOUGHT_PREFIX = re.compile(r"^\s*\**\s*Thought\s*\d*\s*:\s*\**\s*", re.IGNORECASE)
+CAPITALIZED = re.compile(r"\b[A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*")
+QUESTION_WORDS = {"what", "who", "whom", "whose", "when", "where", "why", "how", "which", "did", "does", "do",
+                  "is", "are", "was", "were", "can", "the", "a", "an", "in", "on", "of"}
+PREFETCH_WORKERS = 4
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def prefetcher() -> ThreadPoolExecutor:
+    """
+    Executor of speculative searches, shared by every agent in the process
+    and created on first use, so agents have no threads of their own to
+    shut down.
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _prefetcher
+
+
+def parse_step(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a completion into its thought and action. The action is found
+    anywhere in the text, whatever its numbering, spacing, case or markdown,
+    and returned as "Search[...]", "Lookup[...]" or "Finish[...]"; it is None
+    when the completion has none.
+    """
+    match = ACTION.search(text)
+    if match is None:
+        return THOUGHT_PREFIX.sub("", text.strip().split("\n")[0]), None
+    thought = THOUGHT_PREFIX.sub("", text[:match.start()].strip()).strip("* \n")
+    return thought, f"{match.group(1).capitalize()}[{match.group(2).strip()}]"
+
+
+def question_keywords(question: str, limit: int = 3) -> List[str]:
+    """
+    Capitalized phrases of a question, e.g. "Velmitra Dorsel" of "What does
+    Velmitra Dorsel keep?": the likely arguments of the first Search.
+    """
+    keywords = []
+    for phrase in CAPITALIZED.findall(question):
+        words = phrase.split()
+        while words and words[0].lower() in QUESTION_WORDS:
+            words.pop(0)
+        if words and " ".join(words) not in keywords:
+            keywords.append(" ".join(words))
+    return keywords[:limit]
+
+
 class ReActDocumentQA:
-    def __init__(self, document: str, index_name: str, max_iterations=5):
+    # Neighbours fetched per Search, and added each time Lookup runs out.
+    PAGE_SIZE = 3
+
+    def __init__(self, document: str, index_name: str, max_iterations=5, searcher=None, client=None,
+                 prompt_builder=None, cache=None, rate_limiter=None, max_retries=5, speculative=None):
         """
         Initialize the ReAct agent with a document and OpenAI configuration.
         
         Args:
-            document (str): The input document text
+            document (str): The input document text, or a stream of its
+                paragraphs such as `Document.paragraphs()`
             index_name (str): Index name for the document.
             model (str): OpenAI model to use (default: gpt-4-turbo-preview)
             max_iterations (int): Maximum number of reasoning iterations
+            searcher: Prepared searcher to use instead of indexing `document`,
+                e.g. a `CorpusSearcher` shared across many documents.
+            client: OpenAI client to use instead of one built from the environment.
+            prompt_builder (PromptBuilder): Few-shot and token budget settings
+                of the prompt; defaults to `PromptBuilder()`.
+            cache (ResponseCache): LLM response cache; defaults to one at
+                LLM_CACHE_PATH if that is set, otherwise no caching.
+            rate_limiter (TokenBucket): Shared limiter every LLM request,
+                retries included, takes a token from.
+            max_retries (int): Retries of rate limited or failed LLM requests.
+            speculative (bool): Overlap retrieval with the LLM: completions
+                are streamed and a Search starts as soon as its Action line
+                is complete, the question's names are searched while the
+                first step is planned, and actions are parsed leniently
+                (`parse_step`) so the Action-only re-call is rarely needed.
+                Defaults to whether REACT_SPECULATIVE is 1, true or yes.
         """
-        self.__entity_searcher = EntitySearcher(index_path=index_name)
-        
-        # Prepares index of document
-        self.__entity_searcher.prepare_index(document)
+        if searcher is None:
+            searcher = EntitySearcher(index_path=index_name)
+            # Prepares index of document
+            searcher.prepare_index(document)
+        self.__entity_searcher = searcher
 
-        self.__kw_lookup = {}
-        self.__model = os.getenv("OPENAI_MODEL")
-        self.__max_iterations = max_iterations
-        self.__client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        self._model = os.getenv("OPENAI_MODEL")
+        self._max_iterations = max_iterations
+        # The SDK's own retries would bypass the rate limiter and the traced retry count.
+        self._client = client if client is not None else OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+        self._prompt_builder = prompt_builder if prompt_builder is not None else PromptBuilder()
+        if cache is None and os.getenv("LLM_CACHE_PATH"):
+            cache = ResponseCache(os.environ["LLM_CACHE_PATH"])
+        self._cache = cache
+        self._rate_limiter = rate_limiter
+        self._max_retries = max_retries
+        if speculative is None:
+            speculative = os.getenv("REACT_SPECULATIVE", "").strip().lower() in ("1", "true", "yes")
+        self._speculative = speculative
+        self._prefetcher = prefetcher() if speculative else None
+        # Token usage and iterations of each answered question, in completion order.
+        self.usage = []
 
-    def __search(self, keywords: str) -> str:
+    @staticmethod
+    def _new_state(documents: list = None) -> dict:
+        """
+        Per-question state: Search results for Lookup, the document filter,
+        searches started ahead of their action and token usage. Kept out of
+        the instance so questions can run concurrently.
+        """
+        return {
+            'kw_lookup': {},
+            'prefetched': {},
+            'documents': documents,
+            'iterations': 0,
+            'usage': {'llm_calls': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0},
+        }
+
+    def _search(self, keywords: str, state: dict) -> str:
         """
         Search the document for relevant keywords and return 1st paragraph.
         """
-        results = self.__entity_searcher.search_entity(keywords)
+        keywords = normalize_query(keywords)
+        prefetched = state['prefetched'].pop(keywords, None)
+        if prefetched is not None:
+            results = prefetched.result()
+        else:
+            results = self.__entity_searcher.search_entity(keywords, top_k=self.PAGE_SIZE, documents=state['documents'])
         
         if not results:
             return "No Results"
         
-        self.__kw_lookup[keywords] = {
-            'paragraphs': [text for text, distance in results],
+        state['kw_lookup'][keywords] = {
+            'paragraphs': [text for text, score in results],
             'cursor': 0
             }
-        return self.__kw_lookup[keywords]['paragraphs'][0]
+        return state['kw_lookup'][keywords]['paragraphs'][0]
 
-    def __lookup(self, keywords: str) -> str:
+    def _lookup(self, keywords: str, state: dict) -> str:
         """
-        Return next paragraph.
+        Return next paragraph, fetching the next page of neighbours once the
+        paragraphs found so far are used up.
         """
-        paragraphs = self.__kw_lookup[keywords]['paragraphs']
-        cursor = self.__kw_lookup[keywords]['cursor']
+        keywords = normalize_query(keywords)
+        paragraphs = state['kw_lookup'][keywords]['paragraphs']
+        cursor = state['kw_lookup'][keywords]['cursor']
         cursor += 1
         
         if cursor == len(paragraphs):
-            return "No Results"
+            results = self.__entity_searcher.search_entity(keywords, top_k=len(paragraphs) + self.PAGE_SIZE,
+                                                           documents=state['documents'])
+            paragraphs = paragraphs + [text for text, score in results if text not in paragraphs]
+            if cursor == len(paragraphs):
+                return "No Results"
         
-        self.__kw_lookup[keywords] = {
+        state['kw_lookup'][keywords] = {
             'paragraphs': paragraphs,
             'cursor': cursor
         }
         return paragraphs[cursor]
         
-    def __execute_action(self, action: str) -> Tuple:
+    def _prefetch(self, keywords: str, state: dict) -> None:
+        """
+        Start the search `_search` would run for `keywords` in the background.
+        """
+        keywords = normalize_query(keywords)
+        if self._prefetcher is None or keywords in state['prefetched']:
+            return
+        context = contextvars.copy_context()
+        state['prefetched'][keywords] = self._prefetcher.submit(
+            context.run, self.__entity_searcher.search_entity, keywords, self.PAGE_SIZE, state['documents'])
+
+    def _on_partial(self, content: str, state: dict) -> Optional[int]:
+        """
+        Look at a completion as it streams in: prefetch a Search as soon as
+        its Action line is complete. Once the model has moved past the Action
+        line, returns where that line ends: the rest of the stream can be
+        dropped and the completion cut there, as the stop sequence would have.
+        """
+        match = ACTION.search(content)
+        if match is None:
+            return None
+        if match.group(1).lower() == "search":
+            self._prefetch(match.group(2).strip(), state)
+        return match.end() if "\n" in content[match.end():] else None
+
+    def _split_step(self, text: str, iteration: int) -> Tuple[str, Optional[str]]:
+        """
+        Thought and action of a step's completion. Without an action, the
+        thought is the first line and the action None.
+        """
+        if self._speculative:
+            return parse_step(text)
+        try:
+            thought, action = text.strip().split(f"\nAction {iteration}: ")
+            return thought, action
+        except ValueError:
+            return text.strip().split('\n')[0], None
+
+    @tracing.traced("action")
+    def _execute_action(self, action: str, state: dict) -> Tuple:
         """
         Execute a single action and return its result.
         """
+        state['iterations'] += 1
         action, param = action[:action.find('[')], action[action.find('[')+1:-1]
+        tracing.annotate(action=action)
         if action == "Search": # Search relevant portions of a doc and return 1st paragraph.
-            result = self.__search(param)
+            result = self._search(param, state)
             return result, False
         if action == "Lookup": # Returns next paragraph.
             try:
-                result = self.__lookup(param)
+                result = self._lookup(param, state)
             except:
                 print("LLM didn't follow instruction...")
                 # In case, llm defy prompt instruction.
-                result = self.__search(param)
+                result = self._search(param, state)
             return result, False
         if action == "Finish":
             return param, True
@@ -85,62 +250,170 @@ class ReActDocumentQA:
         print("LLM didn't follow instruction.")
         return "", False
 
+    def _completion_kwargs(self, messages: list, stop: str) -> dict:
+        """
+        Arguments of the chat completion call planning the next step.
+        """
+        return dict(
+            model=self._model,
+            messages=messages,
+            temperature=0,
+            max_tokens=100,
+            top_p=1,
+            frequency_penalty=0.0,
+            presence_penalty=0.0,
+            stop=stop,
+        )
 
-    def __thought_action(self, content: str, stop: str) -> str:
+    @staticmethod
+    def _record_usage(response, state: dict) -> None:
         """
-        Plan the next action based on the content emitted so far.
+        Add a completion's token usage to the question's totals.
+        """
+        usage = state['usage']
+        usage['llm_calls'] += 1
+        if getattr(response, "usage", None) is None:
+            return
+        usage['prompt_tokens'] += response.usage.prompt_tokens
+        usage['completion_tokens'] += response.usage.completion_tokens
+        details = getattr(response.usage, "prompt_tokens_details", None)
+        usage['cached_tokens'] += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        tracing.annotate(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens,
+                         cached_tokens=(getattr(details, "cached_tokens", 0) or 0) if details else 0)
+        print(f"LLM usage: {response.usage.prompt_tokens} prompt, {response.usage.completion_tokens} completion tokens.")
+
+    def _cache_lookup(self, request: dict, state: dict):
+        """
+        Cached completion text for `request`, or None. A read-only cache
+        never falls through to the LLM, it raises `CacheMiss` instead.
+        """
+        if self._cache is None:
+            return None
+        cached = self._cache.get(request)
+        if cached is not None:
+            state['usage']['cache_hits'] += 1
+            tracing.annotate(cached=True)
+            return cached['content']
+        if self._cache.read_only:
+            raise CacheMiss("LLM request not found in read-only cache.")
+        return None
+
+    def _cache_store(self, request: dict, content: str) -> None:
+        if self._cache is not None:
+            self._cache.put(request, {'content': content})
+
+    def _stream_request(self, request: dict) -> dict:
+        return dict(request, stream=True, stream_options={"include_usage": True})
+
+    def _record_stream_usage(self, request: dict, content: str, usage, state: dict) -> None:
+        """
+        Record a streamed completion's usage, estimated with the prompt
+        builder's token counter when the stream was dropped before its final
+        usage chunk.
+        """
+        if usage is None:
+            counter = self._prompt_builder.counter
+            usage = SimpleNamespace(prompt_tokens=sum(counter.count(m["content"]) for m in request["messages"]),
+                                    completion_tokens=counter.count(content), prompt_tokens_details=None)
+        self._record_usage(SimpleNamespace(usage=usage), state)
+
+    def _finish_question(self, question: str, answer: str, state: dict) -> str:
+        """
+        Record the question's token usage and ReAct iterations, and return
+        its answer.
+        """
+        usage = dict(state['usage'], iterations=state['iterations'], question=question)
+        self.usage.append(usage)
+        tracing.annotate(question=question, iterations=usage['iterations'], llm_calls=usage['llm_calls'],
+                         cache_hits=usage['cache_hits'])
+        print(f"Question used {usage['llm_calls']} LLM calls, {usage['cache_hits']} cache hits, {usage['prompt_tokens']} prompt "
+              f"({usage['cached_tokens']} cached) and {usage['completion_tokens']} completion tokens.")
+        return answer
+
+    def __stream(self, request: dict, state: dict) -> str:
+        """
+        Stream a completion, prefetching its Search as it arrives.
         """
+        stream = call_with_retry(self._client.chat.completions.create, retries=self._max_retries,
+                                 rate_limiter=self._rate_limiter, **self._stream_request(request))
+        content, usage = "", None
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                content += chunk.choices[0].delta.content
+                end = self._on_partial(content, state)
+                if end is not None:
+                    content = content[:end]
+                    stream.close()
+                    break
+        self._record_stream_usage(request, content, usage, state)
+        return content
+
+    @tracing.traced("llm")
+    def __thought_action(self, messages: list, stop: str, state: dict, stream: bool = False) -> str:
+        """
+        Plan the next action based on the content emitted so far. Rate limits
+        and server errors are retried with backoff.
+        """
+        request = self._completion_kwargs(messages, stop)
+        # Outside the try: a replay's CacheMiss has to fail the question, not end it quietly.
+        cached = self._cache_lookup(request, state)
+        if cached is not None:
+            return cached
         try:
-            response = self.__client.chat.completions.create(
-                model=self.__model,
-                messages=[
-                    {"role": "system", "content": content},
-                ],
-                temperature=0,
-                max_tokens=100,
-                top_p=1,
-                frequency_penalty=0.0,
-                presence_penalty=0.0,
-                stop=stop,
-            )
-            return response.choices[0].message.content
+            if stream:
+                content = self.__stream(request, state)
+            else:
+                response = call_with_retry(self._client.chat.completions.create, retries=self._max_retries,
+                                           rate_limiter=self._rate_limiter, **request)
+                self._record_usage(response, state)
+                content = response.choices[0].message.content
+            self._cache_store(request, content)
+            return content
         except Exception as e:
-            print("Exception happened!!!")
+            print(f"Exception happened!!! {e!r}")
+            tracing.annotate(error=repr(e))
             return ""
 
-    def process_question(self, question: str, print_prompt: bool = False) -> str:
+    @tracing.traced("question")
+    def process_question(self, question: str, print_prompt: bool = False, documents: list = None) -> str:
         """
         Process a question using iterative reasoning steps.
         
         Args:
             question (str): The question to answer
+            documents (list): Restrict Search[] to these document names of a
+                corpus searcher; None searches everything.
             
         Returns:
             str: The reasoning process and final answer
         """
-        prompt = f"{instruction_prompt}Question: {question}\n"
+        state = self._new_state(documents)
+        steps = []
+        if self._speculative:
+            for keywords in question_keywords(question):
+                self._prefetch(keywords, state)
         
         answer, success_flag = "", False 
         iteration = 0
-        while iteration < self.__max_iterations:
+        while iteration < self._max_iterations:
             iteration += 1
             print(f"\n--- Iteration {iteration} ---")
             
             # Plan next thought and action
-            message = f"{prompt}Thought {iteration}:"
+            messages = self._prompt_builder.messages(question, steps, f"Thought {iteration}:")
             stop = [f"\nObservation {iteration}:"]
-            thought_action = self.__thought_action(message, stop)
-            try:
-                thought, action = thought_action.strip().split(f"\nAction {iteration}: ")
-            except:
-                thought = thought_action.strip().split('\n')[0]
-                message = f"{prompt}Thought {iteration}: {thought}\nAction {iteration}:"
-                action = self.__thought_action(message, stop=[f"\n"]).strip()
+            thought_action = self.__thought_action(messages, stop, state, stream=self._speculative)
+            thought, action = self._split_step(thought_action, iteration)
+            if action is None:
+                messages = self._prompt_builder.messages(question, steps, f"Thought {iteration}: {thought}\nAction {iteration}:")
+                action = self.__thought_action(messages, [f"\n"], state).strip()
             
             # Execute the planned thought and action
-            observation, done = self.__execute_action(action)
-            step_content = f"Thought {iteration}: {thought}\nAction {iteration}: {action}\nObservation {iteration}: {observation}\n"
-            prompt += step_content
+            observation, done = self._execute_action(action, state)
+            step_content = self._prompt_builder.step(iteration, thought, action, observation)
+            steps.append(step_content)
 
             print("step content:\n", step_content)
             
@@ -151,10 +424,122 @@ class ReActDocumentQA:
                 break
         
         if print_prompt:
-            print("prompt at the end", prompt)
+            print("prompt at the end", self._prompt_builder.scratchpad(question, steps))
         
         # If we hit max iterations without a final answer, generate one
         if not success_flag:
             answer = "Data Not Available"
         
-        return answer
+        return self._finish_question(question, answer, state)
+
+
+class AsyncReActDocumentQA(ReActDocumentQA):
+    def __init__(self, document: str, index_name: str, max_iterations=5, searcher=None, client=None,
+                 prompt_builder=None, cache=None, rate_limiter=None, max_retries=5, speculative=None):
+        """
+        ReAct agent whose questions can run concurrently on one event loop.
+
+        The arguments are those of `ReActDocumentQA`; `client` defaults to an
+        `AsyncOpenAI` built from the environment.
+        """
+        if client is None:
+            client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+        super().__init__(document, index_name, max_iterations=max_iterations, searcher=searcher, client=client,
+                         prompt_builder=prompt_builder, cache=cache, rate_limiter=rate_limiter,
+                         max_retries=max_retries, speculative=speculative)
+
+    async def __stream(self, request: dict, state: dict) -> str:
+        """
+        Stream a completion, prefetching its Search as it arrives.
+        """
+        stream = await acall_with_retry(
+            self._client.chat.completions.create, retries=self._max_retries,
+            rate_limiter=self._rate_limiter, **self._stream_request(request),
+        )
+        content, usage = "", None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                content += chunk.choices[0].delta.content
+                end = self._on_partial(content, state)
+                if end is not None:
+                    content = content[:end]
+                    await stream.close()
+                    break
+        self._record_stream_usage(request, content, usage, state)
+        return content
+
+    @tracing.traced("llm")
+    async def __thought_action(self, messages: list, stop: str, state: dict, stream: bool = False) -> str:
+        """
+        Plan the next action based on the content emitted so far.
+        """
+        request = self._completion_kwargs(messages, stop)
+        # Outside the try: a replay's CacheMiss has to fail the question, not end it quietly.
+        cached = self._cache_lookup(request, state)
+        if cached is not None:
+            return cached
+        try:
+            if stream:
+                content = await self.__stream(request, state)
+            else:
+                response = await acall_with_retry(
+                    self._client.chat.completions.create, retries=self._max_retries,
+                    rate_limiter=self._rate_limiter, **request,
+                )
+                self._record_usage(response, state)
+                content = response.choices[0].message.content
+            self._cache_store(request, content)
+            return content
+        except Exception as e:
+            print(f"Exception happened!!! {e!r}")
+            tracing.annotate(error=repr(e))
+            return ""
+
+    @tracing.traced("question")
+    async def aprocess_question(self, question: str, print_prompt: bool = False, documents: list = None) -> str:
+        """
+        Async `process_question`: LLM calls are awaited and Search/Lookup run
+        in a worker thread, so other questions progress meanwhile.
+        """
+        state = self._new_state(documents)
+        steps = []
+        if self._speculative:
+            for keywords in question_keywords(question):
+                self._prefetch(keywords, state)
+
+        answer, success_flag = "", False
+        iteration = 0
+        while iteration < self._max_iterations:
+            iteration += 1
+
+            # Plan next thought and action
+            messages = self._prompt_builder.messages(question, steps, f"Thought {iteration}:")
+            stop = [f"\nObservation {iteration}:"]
+            thought_action = await self.__thought_action(messages, stop, state, stream=self._speculative)
+            thought, action = self._split_step(thought_action, iteration)
+            if action is None:
+                messages = self._prompt_builder.messages(question, steps, f"Thought {iteration}: {thought}\nAction {iteration}:")
+                action = (await self.__thought_action(messages, [f"\n"], state)).strip()
+
+            # Execute the planned thought and action
+            observation, done = await asyncio.to_thread(self._execute_action, action, state)
+            step_content = self._prompt_builder.step(iteration, thought, action, observation)
+            steps.append(step_content)
+
+            print(f"[{question}] step content:\n", step_content)
+
+            # Check if we should finish
+            if done:
+                answer = observation
+                success_flag = True
+                break
+
+        if print_prompt:
+            print("prompt at the end", self._prompt_builder.scratchpad(question, steps))
+
+        if not success_flag:
+            answer = "Data Not Available"
+
+        return self._finish_question(question, answer, state)
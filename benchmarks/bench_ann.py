@@ -0,0 +1,95 @@
+"""
+Benchmark approximate nearest neighbour index kinds against exact search.
+
+For synthetic corpora of normalized, clustered vectors, reports for every
+`IndexSpec` kind: build time, recall@k against the flat baseline, p50/p99
+single-query latency and serialized index size.
+
+Usage:
+    python -m benchmarks.bench_ann --sizes 10000 100000 1000000 --k 3
+    python -m benchmarks.bench_ann --specs flat hnsw:ef_search=128 ivf:nprobe=32
+"""
+import os
+import argparse
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from utils.ann import IndexSpec
+
+
+def synthetic_vectors(n_vectors: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Normalized vectors drawn around random centroids, closer to sentence
+    embeddings than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((n_clusters, dim)).astype("float32")
+    vectors = centroids[rng.integers(0, n_clusters, n_vectors)]
+    vectors += 0.5 * rng.standard_normal((n_vectors, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_bytes(index) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+
+
+def query_latencies(index, queries: np.ndarray, k: int):
+    """
+    Search one query at a time, as the agent does; returns ids and seconds.
+    """
+    ids, seconds = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k)
+        seconds.append(time.perf_counter() - start)
+        ids.append(found[0])
+    return np.array(ids), np.array(seconds)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--specs", nargs="+", default=["flat", "hnsw", "ivf", "ivfpq"])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'spec':<24} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'MiB':>8}")
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dim)
+        ids = np.arange(size, dtype="int64")
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.integers(0, size, args.queries)]
+        queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+        faiss.normalize_L2(queries)
+
+        truth = None
+        for spec in ["flat"] + [s for s in args.specs if s != "flat"]:
+            start = time.perf_counter()
+            index = IndexSpec.parse(spec).build(vectors, ids)
+            build = time.perf_counter() - start
+
+            found, seconds = query_latencies(index, queries, args.k)
+            if truth is None:
+                truth = found
+            print(f"{size:>9} {spec:<24} {build:>8.2f} {recall(found, truth):>9.3f} "
+                  f"{1e3 * np.percentile(seconds, 50):>8.3f} {1e3 * np.percentile(seconds, 99):>8.3f} "
+                  f"{index_bytes(index) / 2**20:>8.1f}")
+            del index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Offline end-to-end benchmark of the document QA pipeline, compared against
+a stored baseline.
+
+Writes a synthetic TXT document of `--paragraphs` paragraphs hiding
+`--questions` facts, then times, as `run_app` would run them:
+
+- model load: loading the encoder,
+- ingest: streaming the document into a fresh index,
+- index load: preparing the index again for the unchanged document,
+- questions/sec of `ReActDocumentQA` and of `AsyncReActDocumentQA` with
+  `--concurrency`, each with a fresh searcher and empty query cache.
+
+The LLM is `ScriptedLLM` (see `benchmarks.fake_llm`), which answers with
+`--llm-latency` seconds of delay, or with `--replay` completions recorded
+in a response cache by `--record` (the only mode calling the real model
+configured in `.env`). Answer accuracy, ReAct iterations and LLM calls per
+question, peak RSS and p50/p95 per traced stage are reported too.
+
+Results are compared with `--baseline` when it exists; any metric worse by
+more than `--tolerance` is flagged and the exit status is 1. `--save-baseline`
+stores the current results there instead. The encoder has to be in the
+local Hugging Face cache; nothing is downloaded.
+
+Usage:
+    python -m benchmarks.bench_e2e --paragraphs 2000 --questions 20
+    python -m benchmarks.bench_e2e --save-baseline
+    python -m benchmarks.bench_e2e --llm-latency 0.2 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+
+from benchmarks.common import synthetic_qa
+
+BASELINE = os.path.join(os.path.dirname(__file__), "e2e_baseline.json")
+# Metrics where a larger value is better; for all others smaller is better.
+HIGHER_IS_BETTER = ("ingest_paragraphs_per_s", "sync_qps", "async_qps", "accuracy")
+# Stage latencies changing by less than this many milliseconds are noise.
+MIN_MS = 1.0
+
+
+def answer_all(args, searcher, facts: dict, is_async: bool) -> tuple:
+    """
+    Answer every question, returning (seconds, answers, agent).
+    """
+    from agentqa import ReActDocumentQA, AsyncReActDocumentQA
+    from utils.llm_cache import ResponseCache
+    from benchmarks.fake_llm import ScriptedLLM, AsyncScriptedLLM, ReplayLLM, AsyncReplayLLM
+
+    questions = list(facts)
+    cache = None
+    if args.record:
+        # The agents build a real client from the environment and record its completions.
+        client, cache = None, ResponseCache(args.record)
+    elif args.replay:
+        client = (AsyncReplayLLM if is_async else ReplayLLM)(args.replay, latency=args.llm_latency)
+    else:
+        client = (AsyncScriptedLLM if is_async else ScriptedLLM)(facts, latency=args.llm_latency)
+
+    start = time.perf_counter()
+    if not is_async:
+        agent = ReActDocumentQA(None, index_name="e2e", searcher=searcher, client=client, cache=cache)
+        answers = [agent.process_question(question) for question in questions]
+        return time.perf_counter() - start, answers, agent
+
+    agent = AsyncReActDocumentQA(None, index_name="e2e", searcher=searcher, client=client, cache=cache)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def answer(question):
+        async with semaphore:
+            return await agent.aprocess_question(question)
+
+    async def answer_batch():
+        return await asyncio.gather(*(answer(question) for question in questions))
+
+    answers = asyncio.run(answer_batch())
+    return time.perf_counter() - start, answers, agent
+
+
+def run(args, doc_dir: str) -> dict:
+    from utils import tracing
+    from utils.document import Document
+    from utils.encoder import get_encoder
+    from utils.searcher import EntitySearcher
+
+    paragraphs, facts = synthetic_qa(args.paragraphs, args.questions, seed=args.seed)
+    with open(os.path.join(doc_dir, "e2e.txt"), "w") as f:
+        f.write("\n\n".join(paragraphs))
+
+    sink = tracing.MemorySink()
+    tracing.add_sink(sink)
+    try:
+        start = time.perf_counter()
+        get_encoder(args.model).load()
+        model_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        EntitySearcher(model_name=args.model, index_path="e2e").prepare_index(
+            Document(doc_name="e2e.txt", type="TXT").paragraphs(pages=True))
+        ingest = time.perf_counter() - start
+
+        start = time.perf_counter()
+        EntitySearcher(model_name=args.model, index_path="e2e").prepare_index(
+            Document(doc_name="e2e.txt", type="TXT").paragraphs(pages=True))
+        index_load = time.perf_counter() - start
+
+        results = {}
+        for mode in ("sync", "async"):
+            get_encoder(args.model).clear_cache()
+            searcher = EntitySearcher(model_name=args.model, index_path="e2e")
+            searcher.prepare_index(Document(doc_name="e2e.txt", type="TXT").paragraphs(pages=True))
+            seconds, answers, agent = answer_all(args, searcher, facts, mode == "async")
+            results[mode] = (seconds, answers, agent.usage)
+    finally:
+        tracing.remove_sink(sink)
+
+    expected = [answer for _, answer in facts.values()]
+    sync_seconds, answers, usage = results["sync"]
+    metrics = {
+        "model_load_s": model_load,
+        "ingest_s": ingest,
+        "ingest_paragraphs_per_s": len(paragraphs) / ingest,
+        "index_load_s": index_load,
+        "sync_qps": len(facts) / sync_seconds,
+        "async_qps": len(facts) / results["async"][0],
+        "accuracy": sum(a == e for a, e in zip(answers, expected)) / len(facts),
+        "iterations_per_question": sum(u["iterations"] for u in usage) / len(facts),
+        "llm_calls_per_question": sum(u["llm_calls"] for u in usage) / len(facts),
+        "prompt_tokens_per_question": sum(u["prompt_tokens"] for u in usage) / len(facts),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    for name, stage in tracing.summarize(sink.spans)["stages"].items():
+        metrics[f"{name}_p50_ms"] = stage["p50_ms"]
+        metrics[f"{name}_p95_ms"] = stage["p95_ms"]
+    return metrics
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Print current vs baseline metrics; returns whether any regressed.
+    """
+    regressed = False
+    print(f"{'metric':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, value in metrics.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:<28} {'-':>10} {value:>10.3f}")
+            continue
+        change = (value - old) / old if old else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if name.endswith("_ms") and abs(value - old) < MIN_MS:
+            worse = 0.0
+        flag = "  REGRESSION" if worse > tolerance else ""
+        regressed |= bool(flag)
+        print(f"{name:<28} {old:>10.3f} {value:>10.3f} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds each fake LLM call takes")
+    parser.add_argument("--replay", help="response cache to replay instead of the scripted LLM")
+    parser.add_argument("--record", help="call the configured OpenAI model and record its responses here")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change flagged as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the agents' output")
+    args = parser.parse_args()
+
+    # The encoder comes from the local cache and the agents' own response cache stays off.
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.pop("LLM_CACHE_PATH", None)
+    os.environ.setdefault("OPENAI_MODEL", "gpt-4o-mini")
+    with tempfile.TemporaryDirectory() as doc_dir:
+        os.environ["INDEX_DIR"] = doc_dir
+        os.environ["DOC_PATH"] = doc_dir
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            metrics = run(args, doc_dir)
+
+    config = {key: getattr(args, key) for key in ("model", "paragraphs", "questions", "seed", "concurrency",
+                                                  "llm_latency", "replay")}
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"config": config, "metrics": metrics}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}.")
+    if args.save_baseline or not os.path.exists(args.baseline):
+        for name, value in metrics.items():
+            print(f"{name:<28} {value:>10.3f}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["config"] != config:
+        print(f"Baseline was run with {baseline['config']}, not {config}.")
+    if compare(metrics, baseline["metrics"], args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark paragraph embedding throughput for an index build.
+
+Compares the original per-paragraph, max_length padded path against the
+batched, dynamically padded `Encoder.embed` used by `EntitySearcher`. Both
+embed the same paragraphs, one vector each; model loading, chunking and
+index writes are not timed.
+
+Usage:
+    python -m benchmarks.bench_embedding --paragraphs 5000 --batch-size 32
+"""
+import argparse
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+from benchmarks.common import synthetic_paragraphs
+
+
+def baseline_rate(model_name: str, paragraphs: list) -> float:
+    """
+    Paragraphs/sec of the original one-call-per-paragraph embedding.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    start = time.perf_counter()
+    for text in paragraphs:
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512, padding="max_length")
+        with torch.no_grad():
+            outputs = model(**inputs)
+            outputs.last_hidden_state.mean(dim=1).squeeze(0).cpu().numpy()
+    return len(paragraphs) / (time.perf_counter() - start)
+
+
+def batched_rate(model_name: str, paragraphs: list, batch_size: int) -> float:
+    """
+    Paragraphs/sec of `Encoder.embed`, the batched path of an index build.
+    """
+    from utils.encoder import get_encoder
+
+    encoder = get_encoder(model_name)
+    encoder.embed(paragraphs[:batch_size], batch_size)
+    start = time.perf_counter()
+    encoder.embed(paragraphs, batch_size)
+    return len(paragraphs) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--paragraphs", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--baseline-sample", type=int, default=500,
+                        help="Paragraphs embedded with the original path; it is too slow to run on all of them.")
+    args = parser.parse_args()
+
+    paragraphs = synthetic_paragraphs(args.paragraphs)
+    before = baseline_rate(args.model, paragraphs[:args.baseline_sample])
+    after = batched_rate(args.model, paragraphs, args.batch_size)
+
+    print(f"paragraphs:            {len(paragraphs)}")
+    print(f"before (per-paragraph): {before:10.1f} paragraphs/sec")
+    print(f"after  (batched):       {after:10.1f} paragraphs/sec")
+    print(f"speedup:                {after / before:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
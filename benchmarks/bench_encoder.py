@@ -0,0 +1,130 @@
+"""
+Benchmark encoder backends and vector storages, and check backend parity.
+
+Backends (see `utils.encoder.Encoder`): load time, paragraphs/sec embedding
+`--paragraphs` synthetic paragraphs, and p50/p95 latency of single query
+embeddings. Parity with the torch float32 backend: mean and minimum cosine
+similarity of the same texts' embeddings, and the overlap of their top
+`--top-k` search results.
+
+Storages (see `utils.ann.IndexSpec`): bytes of a flat index of the torch
+embeddings, recall@k against float32 and p50 search latency.
+
+With `--check` the exit status is 1 when a backend's minimum cosine falls
+below its bound (`--min-cosine`, by default 0.9999 for onnx and 0.98 for
+the int8 backends), so it can gate changes to the inference path.
+
+Usage:
+    python -m benchmarks.bench_encoder --paragraphs 1000 --queries 200
+    python -m benchmarks.bench_encoder --backends torch onnx --check
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from benchmarks.common import synthetic_paragraphs, WORDS
+
+MIN_COSINE = {"onnx": 0.9999, "torch-int8": 0.98, "onnx-int8": 0.98}
+
+
+def top_k(embeddings: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ embeddings.T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def overlap(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean([len(set(x) & set(y)) / len(x) for x, y in zip(a, b)]))
+
+
+def bench_backends(args, paragraphs: list, queries: list) -> tuple:
+    from utils.encoder import Encoder
+
+    rows, reference = {}, None
+    for backend in args.backends:
+        encoder = Encoder(args.model, backend=backend)
+        start = time.perf_counter()
+        encoder.load()
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        embeddings = encoder.embed(paragraphs, args.batch_size)
+        throughput = len(paragraphs) / (time.perf_counter() - start)
+
+        latencies, query_embeddings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            query_embeddings.append(encoder.embed_query(query))
+            latencies.append(time.perf_counter() - start)
+        query_embeddings = np.concatenate(query_embeddings)
+        p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+
+        if reference is None:
+            reference = (embeddings, query_embeddings, top_k(embeddings, query_embeddings, args.top_k))
+        cosines = np.concatenate([(embeddings * reference[0]).sum(axis=1),
+                                  (query_embeddings * reference[1]).sum(axis=1)])
+        agreement = overlap(top_k(embeddings, query_embeddings, args.top_k), reference[2])
+        rows[backend] = (load, throughput, p50, p95, float(cosines.mean()), float(cosines.min()), agreement)
+    return rows, reference
+
+
+def bench_storages(args, embeddings: np.ndarray, queries: np.ndarray) -> dict:
+    import faiss
+    from utils.ann import IndexSpec
+
+    ids = np.arange(len(embeddings), dtype="int64")
+    rows, exact = {}, None
+    for storage in ("float32", "float16", "int8"):
+        index = IndexSpec("flat", storage=storage).build(embeddings, ids)
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(index.search(query[None, :], args.top_k)[1][0])
+            latencies.append(time.perf_counter() - start)
+        if exact is None:
+            exact = results
+        rows[storage] = (len(faiss.serialize_index(index)), overlap(results, exact),
+                         float(np.percentile(np.array(latencies) * 1000, 50)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--paragraphs", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--check", action="store_true", help="fail when a backend drifts beyond its bound")
+    parser.add_argument("--min-cosine", type=float, help="bound for every backend other than torch")
+    args = parser.parse_args()
+    if args.backends[0] != "torch":
+        args.backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+
+    rng = np.random.default_rng(0)
+    paragraphs = synthetic_paragraphs(args.paragraphs)
+    queries = [" ".join(rng.choice(WORDS, rng.integers(1, 4))) + f" {i}" for i in range(args.queries)]
+
+    rows, (embeddings, query_embeddings, _) = bench_backends(args, paragraphs, queries)
+    print(f"{'backend':<11} {'load s':>7} {'para/s':>8} {'q p50 ms':>9} {'q p95 ms':>9} "
+          f"{'mean cos':>9} {'min cos':>9} {'top-' + str(args.top_k):>7}")
+    for backend, (load, throughput, p50, p95, mean_cos, min_cos, agreement) in rows.items():
+        print(f"{backend:<11} {load:>7.2f} {throughput:>8.1f} {p50:>9.2f} {p95:>9.2f} "
+              f"{mean_cos:>9.5f} {min_cos:>9.5f} {agreement:>7.3f}")
+
+    print(f"\n{'storage':<11} {'bytes':>10} {'recall@' + str(args.top_k):>9} {'p50 ms':>8}")
+    for storage, (size, recall, p50) in bench_storages(args, embeddings, query_embeddings).items():
+        print(f"{storage:<11} {size:>10} {recall:>9.3f} {p50:>8.3f}")
+
+    if args.check:
+        failed = [backend for backend, row in rows.items()
+                  if backend != "torch" and row[5] < (args.min_cosine or MIN_COSINE[backend])]
+        print(f"\nParity {'failed for ' + ', '.join(failed) if failed else 'ok'}.")
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark PDF ingestion: pages/sec and peak RSS on a large generated PDF.
+
+"before" replays the original pipeline, which concatenated every page into
+one string, ran the paragraph regex over it and split it into a list;
+"after" streams `Document.paragraphs()` from a process pool of `--workers`.
+With `--model` the paragraphs are also embedded into a fresh index, through
+`EntitySearcher.prepare_index` with the text ("before") or the stream
+("after"). Each mode runs in a fresh interpreter; peak RSS is reported for
+the main process and for the largest worker.
+
+Usage:
+    python -m benchmarks.bench_ingest --pages 1000 --workers 4
+    python -m benchmarks.bench_ingest --pages 200 --model sentence-transformers/all-MiniLM-L6-v2
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from benchmarks.common import synthetic_pdf
+
+
+def counted(paragraphs, count: list):
+    """
+    Pass a stream through, counting its items into `count[0]`.
+    """
+    for paragraph in paragraphs:
+        count[0] += 1
+        yield paragraph
+
+
+def child(mode: str, doc_dir: str, workers: int, model_name: str) -> None:
+    os.environ["DOC_PATH"] = doc_dir
+    import PyPDF2
+    from utils.document import Document
+    from utils.chunker import split_paragraphs
+
+    start = time.perf_counter()
+    if mode == "before":
+        text = ""
+        with open(os.path.join(doc_dir, "large.pdf"), "rb") as file:
+            reader = PyPDF2.PdfReader(file)
+            n_pages = len(reader.pages)
+            for page in reader.pages:
+                text += page.extract_text()
+        text = re.sub(r"(?<![.!?])\n(?!\n)", " ", text)
+        document = text
+        n_paragraphs = sum(1 for _ in split_paragraphs(text))
+    else:
+        n_pages = len(PyPDF2.PdfReader(os.path.join(doc_dir, "large.pdf")).pages)
+        count = [0]
+        document = counted(Document(doc_name="large.pdf", type="PDF", workers=workers).paragraphs(), count)
+
+    if model_name:
+        from utils.searcher import EntitySearcher
+        EntitySearcher(model_name=model_name, index_path=f"large_{mode}").prepare_index(document)
+    elif mode == "after":
+        for _ in document:
+            pass
+    if mode == "after":
+        n_paragraphs = count[0]
+    seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "pages": n_pages,
+        "paragraphs": n_paragraphs,
+        "seconds": seconds,
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def run(mode: str, doc_dir: str, workers: int, model_name: str) -> dict:
+    command = [sys.executable, "-m", "benchmarks.bench_ingest", "--child", mode, "--doc-dir", doc_dir,
+               "--workers", str(workers)]
+    if model_name:
+        command += ["--model", model_name]
+    out = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--model", help="also embed and index the paragraphs with this encoder")
+    parser.add_argument("--child", choices=["before", "after"], help=argparse.SUPPRESS)
+    parser.add_argument("--doc-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.doc_dir, args.workers, args.model)
+        return
+
+    with tempfile.TemporaryDirectory() as doc_dir:
+        os.environ["INDEX_DIR"] = doc_dir
+        synthetic_pdf(os.path.join(doc_dir, "large.pdf"), args.pages)
+        size_mib = os.path.getsize(os.path.join(doc_dir, "large.pdf")) / 2 ** 20
+        print(f"{args.pages} pages, {size_mib:.1f} MiB PDF, {args.workers} workers")
+        results = {mode: run(mode, doc_dir, args.workers, args.model) for mode in ("before", "after")}
+
+    print(f"{'mode':<8} {'paragraphs':>10} {'pages/s':>9} {'peak RSS MiB':>13} {'worker RSS MiB':>15}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['paragraphs']:>10} {result['pages'] / result['seconds']:>9.1f} "
+              f"{result['peak_rss_mib']:>13.1f} {result['worker_peak_rss_mib']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
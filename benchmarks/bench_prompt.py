@@ -0,0 +1,53 @@
+"""
+Compare prompt sizes of the original single-message prompt and PromptBuilder.
+
+Replays a synthetic question of `--iterations` Search steps whose
+observations are paragraphs of `--observation-words` words, and counts the
+prompt tokens sent at every step. No LLM is called.
+
+Usage:
+    python -m benchmarks.bench_prompt --iterations 5 --examples 3
+"""
+import argparse
+
+from utils.prompts import instruction_prompt
+from utils.prompt_builder import PromptBuilder
+from benchmarks.common import synthetic_paragraphs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--observation-words", type=int, default=300)
+    parser.add_argument("--examples", type=int, default=3)
+    parser.add_argument("--max-observation-tokens", type=int, default=256)
+    parser.add_argument("--max-history-tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    builder = PromptBuilder(n_examples=args.examples, max_observation_tokens=args.max_observation_tokens,
+                            max_history_tokens=args.max_history_tokens)
+    count = builder.counter.count
+    question = "What did Lily bring to the pond and why?"
+    observations = synthetic_paragraphs(args.iterations, args.observation_words, args.observation_words)
+
+    before = after = static = 0
+    prompt, steps = f"{instruction_prompt}Question: {question}\n", []
+    for iteration, observation in enumerate(observations, start=1):
+        before += count(f"{prompt}Thought {iteration}:")
+        messages = builder.messages(question, steps, f"Thought {iteration}:")
+        after += sum(count(message["content"]) for message in messages)
+        static += count(messages[0]["content"])
+
+        thought, action = "I need to search more.", f"Search[keyword {iteration}]"
+        prompt += f"Thought {iteration}: {thought}\nAction {iteration}: {action}\nObservation {iteration}: {observation}\n"
+        steps.append(builder.step(iteration, thought, action, observation))
+
+    print(f"LLM calls per question:          {args.iterations}")
+    print(f"prompt tokens, original prompt:  {before}")
+    print(f"prompt tokens, PromptBuilder:    {after}")
+    print(f"  of which cacheable prefix:     {static}")
+    print(f"reduction:                       {1 - after / before:.1%}")
+
+
+if __name__ == "__main__":
+    main()
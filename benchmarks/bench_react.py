@@ -0,0 +1,119 @@
+"""
+Benchmark the ReAct loop: the serial loop against `speculative=True`, which
+streams completions, starts a Search as soon as its Action line is complete,
+prefetches the question's names before the first step and parses actions
+leniently.
+
+`--questions` synthetic questions over a document of `--paragraphs`
+paragraphs are answered one at a time by `ScriptedLLM`, which takes
+`--llm-latency` seconds to its first token, `--token-latency` per streamed
+word, and writes `--malformed` of its Action lines in a shape the serial
+loop cannot split (see `benchmarks.fake_llm.MALFORMED`). Reported per mode:
+p50/p95/mean latency per question, LLM calls and iterations per answer, and
+accuracy. Each mode starts with a fresh searcher and empty query cache.
+
+Usage:
+    python -m benchmarks.bench_react --questions 30 --llm-latency 0.3 --token-latency 0.01
+    python -m benchmarks.bench_react --malformed 0 --async
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+import numpy as np
+
+from benchmarks.common import synthetic_qa
+
+
+def answer_all(args, searcher, facts: dict, speculative: bool) -> list:
+    from agentqa import ReActDocumentQA, AsyncReActDocumentQA
+    from benchmarks.fake_llm import ScriptedLLM, AsyncScriptedLLM
+
+    options = dict(latency=args.llm_latency, token_latency=args.token_latency, malformed=args.malformed,
+                   seed=args.seed)
+    if not args.use_async:
+        agent = ReActDocumentQA(None, index_name="react", searcher=searcher, client=ScriptedLLM(facts, **options),
+                                speculative=speculative)
+        return [agent.process_question(question) for question in facts]
+
+    agent = AsyncReActDocumentQA(None, index_name="react", searcher=searcher,
+                                 client=AsyncScriptedLLM(facts, **options), speculative=speculative)
+
+    async def answer_each():
+        return [await agent.aprocess_question(question) for question in facts]
+
+    return asyncio.run(answer_each())
+
+
+def run(args) -> dict:
+    from utils import tracing
+    from utils.encoder import get_encoder
+    from utils.searcher import EntitySearcher
+
+    paragraphs, facts = synthetic_qa(args.paragraphs, args.questions, seed=args.seed)
+    EntitySearcher(model_name=args.model, index_path="react").prepare_index("\n".join(paragraphs))
+    expected = [answer for _, answer in facts.values()]
+
+    results = {}
+    for mode in ("serial", "speculative"):
+        get_encoder(args.model).clear_cache()
+        searcher = EntitySearcher(model_name=args.model, index_path="react")
+        searcher.load_index()
+        sink = tracing.MemorySink()
+        tracing.add_sink(sink)
+        try:
+            start = time.perf_counter()
+            answers = answer_all(args, searcher, facts, mode == "speculative")
+            seconds = time.perf_counter() - start
+        finally:
+            tracing.remove_sink(sink)
+        questions = [span for span in sink.spans if span["name"] == "question"]
+        latencies = np.array([span["duration_ms"] for span in questions])
+        results[mode] = {
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "mean_ms": float(latencies.mean()),
+            "llm_calls": sum(span["attrs"]["llm_calls"] for span in questions) / len(questions),
+            "iterations": sum(span["attrs"]["iterations"] for span in questions) / len(questions),
+            "accuracy": sum(a == e for a, e in zip(answers, expected)) / len(facts),
+            "seconds": seconds,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds to the first token of a call")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per streamed word")
+    parser.add_argument("--malformed", type=float, default=0.2, help="fraction of malformed Action lines")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use AsyncReActDocumentQA")
+    parser.add_argument("--verbose", action="store_true", help="show the agents' output")
+    args = parser.parse_args()
+
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.pop("LLM_CACHE_PATH", None)
+    os.environ.setdefault("OPENAI_MODEL", "gpt-4o-mini")
+    with tempfile.TemporaryDirectory() as index_dir:
+        os.environ["INDEX_DIR"] = index_dir
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            results = run(args)
+
+    print(f"{args.questions} questions, {args.llm_latency}s to first token, {args.token_latency}s per word, "
+          f"{args.malformed:.0%} malformed actions")
+    print(f"{'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'calls/ans':>10} {'iters/ans':>10} "
+          f"{'accuracy':>9}")
+    for mode, result in results.items():
+        print(f"{mode:<12} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['mean_ms']:>8.1f} "
+              f"{result['llm_calls']:>10.2f} {result['iterations']:>10.2f} {result['accuracy']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
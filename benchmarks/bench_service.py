@@ -0,0 +1,139 @@
+"""
+Benchmark many concurrent agents searching one index: every process with
+its own encoder ("local") vs all of them sharing the micro-batched search
+service ("server", over a Unix socket).
+
+`--processes` client processes with `--threads` threads each run
+`--queries` distinct searches per thread. All clients load first and start
+searching together; aggregate QPS, p50/p99 search latency and the summed
+peak RSS of clients and server are reported.
+
+Usage:
+    python -m benchmarks.bench_service --processes 8 --threads 4 --queries 50
+    python -m benchmarks.bench_service --model sentence-transformers/all-MiniLM-L6-v2 --max-wait-ms 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+
+from benchmarks.common import synthetic_document, WORDS
+
+
+def peak_rss_mib(pid: int) -> float:
+    """
+    Peak RSS of a process. Unlike ru_maxrss, which a child inherits from the
+    parent that forked it, VmHWM starts over with the new program.
+    """
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(mode: str, model_name: str, server: str, threads: int, n_queries: int, seed: int) -> None:
+    from utils.encoder import get_encoder
+    from utils.searcher import EntitySearcher
+
+    if mode == "local":
+        searcher = EntitySearcher(model_name=model_name, index_path="service", server="")
+        searcher.load_index()
+        get_encoder(model_name).load()
+    else:
+        searcher = EntitySearcher(model_name=model_name, index_path="service", server=server)
+    rng = np.random.default_rng(seed)
+    queries = [[f"{' '.join(rng.choice(WORDS, 3))} {seed}-{t}-{i}" for i in range(n_queries)] for t in range(threads)]
+    latencies = []
+
+    def work(thread_queries):
+        for query in thread_queries:
+            start = time.perf_counter()
+            searcher.search_entity(query)
+            latencies.append(time.perf_counter() - start)
+
+    print("ready", flush=True)
+    sys.stdin.readline()
+    start = time.time()
+    workers = [threading.Thread(target=work, args=(chunk,)) for chunk in queries]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(json.dumps({"start": start, "end": time.time(), "latencies": latencies,
+                      "peak_rss_mib": peak_rss_mib(os.getpid())}), flush=True)
+
+
+def run(mode: str, args, server: str) -> dict:
+    command = [sys.executable, "-m", "benchmarks.bench_service", "--child", mode, "--model", args.model,
+               "--threads", str(args.threads), "--queries", str(args.queries)]
+    children = [subprocess.Popen(command + ["--seed", str(i), "--server", server or ""], stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE, text=True) for i in range(args.processes)]
+    for process in children:
+        while process.stdout.readline().strip() != "ready":
+            pass
+    for process in children:
+        process.stdin.write("go\n")
+        process.stdin.flush()
+    results = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in children]
+
+    latencies = np.concatenate([result["latencies"] for result in results]) * 1000
+    seconds = max(result["end"] for result in results) - min(result["start"] for result in results)
+    return {"qps": len(latencies) / seconds, "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "rss_mib": sum(result["peak_rss_mib"] for result in results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50, help="searches per thread")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--child", choices=["local", "server"], help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    parser.add_argument("--seed", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.model, args.server, args.threads, args.queries, args.seed)
+        return
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        os.environ["INDEX_DIR"] = index_dir
+        os.environ.pop("EMBEDDING_SERVER", None)
+        from utils.searcher import EntitySearcher
+        EntitySearcher(model_name=args.model, index_path="service", server="").prepare_index(
+            synthetic_document(args.paragraphs))
+
+        results = {"local": run("local", args, None)}
+        socket_path = os.path.join(index_dir, "search.sock")
+        server = subprocess.Popen([sys.executable, "-m", "utils.search_service", "--model", args.model,
+                                   "--socket", socket_path, "--max-batch", str(args.max_batch),
+                                   "--max-wait-ms", str(args.max_wait_ms)], stdout=subprocess.PIPE, text=True)
+        try:
+            server.stdout.readline()
+            results["server"] = run("server", args, f"unix://{socket_path}")
+            results["server"]["rss_mib"] += peak_rss_mib(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.processes} processes x {args.threads} threads x {args.queries} queries")
+    print(f"{'mode':<8} {'QPS':>8} {'p50 ms':>8} {'p99 ms':>8} {'RSS MiB':>9}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['qps']:>8.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['rss_mib']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
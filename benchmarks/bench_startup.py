@@ -0,0 +1,137 @@
+"""
+Benchmark startup time and peak RSS for loading many existing indexes.
+
+"before" replays the original constructor, which loaded a tokenizer and a
+model per EntitySearcher; "after" uses the shared, lazily loaded encoder.
+Each mode runs in a fresh interpreter so import cost is included.
+
+Then one index of `--vectors` random vectors and kind `--index` is built and
+loaded by `IndexStore.load` with and without `mmap`, reporting the resident
+memory the load adds. A mapped index should add next to none, including the
+flat kind, whose codes are only mapped with IO_FLAG_MMAP_IFC.
+
+Usage:
+    python -m benchmarks.bench_startup --indexes 50
+    python -m benchmarks.bench_startup --indexes 5 --index hnsw --vectors 200000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from benchmarks.common import synthetic_document
+
+
+def child(mode: str, model_name: str, count: int) -> None:
+    start = time.perf_counter()
+    if mode == "before":
+        from transformers import AutoTokenizer, AutoModel
+    from utils.searcher import EntitySearcher
+
+    searchers = []
+    for i in range(count):
+        if mode == "before":
+            AutoTokenizer.from_pretrained(model_name)
+            searchers.append(AutoModel.from_pretrained(model_name))
+        searcher = EntitySearcher(model_name=model_name, index_path=f"doc_{i}")
+        searcher.prepare_index(synthetic_document(20, seed=i))
+        searchers.append(searcher)
+    loaded = time.perf_counter() - start
+
+    searchers[-1].search_entity("lion")
+    first_query = time.perf_counter() - start - loaded
+
+    print(json.dumps({
+        "load_seconds": loaded,
+        "first_query_seconds": first_query,
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def rss_mib() -> float:
+    """
+    Current resident set size; ru_maxrss is a peak and survives exec.
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def index_child(mode: str, spec: str, n_vectors: int, dim: int) -> None:
+    import numpy as np
+    from utils.index_store import IndexStore
+
+    path = os.path.join(os.environ["INDEX_DIR"], "rss")
+    store = IndexStore(path, "random", spec)
+    if mode == "build":
+        rng = np.random.default_rng(0)
+
+        def embed(texts: list) -> np.ndarray:
+            vectors = rng.standard_normal((len(texts), dim)).astype("float32")
+            return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        store.load()
+        store.sync({"rss": "\n".join(f"Paragraph {i}." for i in range(n_vectors))},
+                   lambda text: text.split("\n"), embed)
+        store.save()
+        print(json.dumps({"vectors": store.index.ntotal}))
+        return
+
+    before = rss_mib()
+    assert store.load(mmap=mode == "mmap"), "Index was not built."
+    print(json.dumps({"load_rss_mib": rss_mib() - before}))
+
+
+def run(mode: str, args) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", mode, "--model", args.model,
+         "--indexes", str(args.indexes), "--index", args.index, "--vectors", str(args.vectors),
+         "--dim", str(args.dim)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--indexes", type=int, default=50)
+    parser.add_argument("--index", default="flat", help="index spec of the RSS check, e.g. flat, hnsw, ivf")
+    parser.add_argument("--vectors", type=int, default=200_000, help="vectors in the RSS check index")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--child", choices=["before", "after", "build", "mmap", "copy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child in ("before", "after"):
+        child(args.child, args.model, args.indexes)
+        return
+    if args.child:
+        index_child(args.child, args.index, args.vectors, args.dim)
+        return
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        os.environ["INDEX_DIR"] = index_dir
+        # Build the indexes once; both modes then only load them.
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", "after",
+                        "--model", args.model, "--indexes", str(args.indexes)], check=True, capture_output=True)
+        results = {mode: run(mode, args) for mode in ("before", "after")}
+        run("build", args)
+        loads = {mode: run(mode, args) for mode in ("copy", "mmap")}
+
+    print(f"{'mode':<8} {'load s':>8} {'1st query s':>12} {'peak RSS MiB':>13}")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['load_seconds']:>8.2f} {result['first_query_seconds']:>12.2f} "
+              f"{result['peak_rss_mib']:>13.1f}")
+
+    print(f"\n{args.vectors} x {args.dim} {args.index} index")
+    print(f"{'load':<8} {'RSS added MiB':>14}")
+    for mode, result in loads.items():
+        print(f"{mode:<8} {result['load_rss_mib']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
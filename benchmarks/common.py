@@ -0,0 +1,96 @@
+import random
+
+WORDS = (
+    "the a river village lion forest morning pond friend journey light stone "
+    "market king queen ship storm garden river mountain letter school teacher "
+    "city bridge winter summer festival harvest lantern story secret map"
+).split()
+SYLLABLES = "ka zor vel mi tra quin dor sel ra lo bek thu nai fen gri os".split()
+
+
+def entity_name(rng: random.Random) -> str:
+    """
+    A made-up two word name such as "Velmitra Dorsel".
+    """
+    return " ".join("".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize() for _ in range(2))
+
+
+def synthetic_paragraphs(n_paragraphs: int, min_words: int = 8, max_words: int = 120, seed: int = 0) -> list:
+    """
+    Generate `n_paragraphs` pseudo-random paragraphs of uneven length.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    for i in range(n_paragraphs):
+        n_words = rng.randint(min_words, max_words)
+        words = [rng.choice(WORDS) for _ in range(n_words)]
+        paragraphs.append(f"Paragraph {i}: " + " ".join(words).capitalize() + ".")
+    return paragraphs
+
+
+def synthetic_document(n_paragraphs: int, **kwargs) -> str:
+    """
+    Generate a newline separated document, as produced by `Document.document`.
+    """
+    return "\n".join(synthetic_paragraphs(n_paragraphs, **kwargs))
+
+
+def synthetic_qa(n_paragraphs: int, n_questions: int, seed: int = 0) -> tuple:
+    """
+    Synthetic paragraphs with `n_questions` facts hidden among them. Returns
+    the paragraphs and a question -> (entity, answer) dict; each answer is a
+    made-up word found only in its fact's paragraph.
+    """
+    rng = random.Random(seed)
+    paragraphs = synthetic_paragraphs(n_paragraphs, 10, 80, seed=seed)
+    facts = {}
+    for _ in range(n_questions):
+        entity = entity_name(rng)
+        answer = "".join(rng.choice(SYLLABLES) for _ in range(4))
+        paragraphs.insert(rng.randrange(len(paragraphs) + 1),
+                          f"{entity} keeps the {answer} near the {rng.choice(WORDS)} every {rng.choice(WORDS)}.")
+        facts[f"What does {entity} keep?"] = (entity, answer)
+    return paragraphs, facts
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def synthetic_pdf(path: str, n_pages: int, paragraphs_per_page: int = 6, line_chars: int = 90, seed: int = 0) -> None:
+    """
+    Write an `n_pages` PDF of synthetic paragraphs, wrapped into lines, with
+    Helvetica text PyPDF2 can extract. Pages are written one at a time.
+    """
+    offsets = []
+    with open(path, "wb") as f:
+        def obj(body: bytes) -> None:
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        # Pages are objects 4 + 2i, their content streams 5 + 2i.
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages))
+        obj(b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode())
+        obj(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for page in range(n_pages):
+            lines = []
+            for paragraph in synthetic_paragraphs(paragraphs_per_page, 20, 60, seed=seed + page):
+                line = ""
+                for word in paragraph.split():
+                    if line and len(line) + len(word) >= line_chars:
+                        lines.append(line)
+                        line = ""
+                    line = f"{line} {word}" if line else word
+                lines.extend([line, ""])
+            text = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in lines)
+            stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text} ET".encode()
+            obj(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * page} 0 R >>".encode())
+            obj(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
@@ -0,0 +1,127 @@
+"""
+Evaluate hybrid (BM25 + dense, fused by reciprocal rank) against dense-only
+retrieval.
+
+Retrieval: builds an index over synthetic paragraphs that each mention one
+made-up entity, queries every entity name as the agent's `Search[...]`
+would, and reports hit@1, hit@3, MRR and p50/p95 search latency. Query
+embeddings are computed up front and result caching is disabled, so the
+latency is that of the index searches and fusion.
+
+Agent (with `--doc` and `--questions`, calls the LLM configured in `.env`):
+answers the questions with both searchers and reports the average ReAct
+iterations per answer and the latency of the searches made, query
+embedding included.
+
+Usage:
+    python -m benchmarks.eval_hybrid --paragraphs 2000 --queries 200
+    python -m benchmarks.eval_hybrid --doc story.pdf --type PDF --questions questions.json
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import synthetic_paragraphs, entity_name
+
+
+def percentiles(latencies: list) -> str:
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+    return f"{p50:>8.2f} {p95:>8.2f}"
+
+
+def eval_retrieval(model_name: str, n_paragraphs: int, n_queries: int, top_k: int) -> None:
+    from utils.encoder import get_encoder
+    from utils.searcher import EntitySearcher
+    from utils.lru_cache import normalize_query
+
+    rng = random.Random(0)
+    entities = [entity_name(rng) for _ in range(n_paragraphs)]
+    paragraphs = [f"{paragraph} {entity} was there as well."
+                  for paragraph, entity in zip(synthetic_paragraphs(n_paragraphs, 10, 60), entities)]
+    queries = rng.sample(entities, min(n_queries, n_paragraphs))
+    for query in queries:
+        get_encoder(model_name).embed_query(normalize_query(query))
+
+    print(f"{'mode':<8} {'hit@1':>6} {'hit@' + str(top_k):>6} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for hybrid in (False, True):
+        searcher = EntitySearcher(model_name=model_name, index_path="eval_hybrid", cache_size=0, hybrid=hybrid)
+        searcher.prepare_index("\n".join(paragraphs))
+        hits1 = hits_k = reciprocal = 0.0
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            results = searcher.search_entity(query, top_k)
+            latencies.append(time.perf_counter() - start)
+            ranks = [rank for rank, (text, _) in enumerate(results, start=1) if query in text]
+            if ranks:
+                hits1 += ranks[0] == 1
+                hits_k += 1
+                reciprocal += 1 / ranks[0]
+        n = len(queries)
+        print(f"{'hybrid' if hybrid else 'dense':<8} {hits1 / n:>6.2f} {hits_k / n:>6.2f} {reciprocal / n:>6.2f} "
+              f"{percentiles(latencies)}")
+
+
+def eval_agent(model_name: str, doc_name: str, doc_type: str, questions: list) -> None:
+    from utils.document import Document
+    from utils.encoder import get_encoder
+    from utils.searcher import EntitySearcher
+    from agentqa import ReActDocumentQA
+
+    index_name = f"eval_{doc_name[:doc_name.find('.')]}"
+    rows = {}
+    for hybrid in (False, True):
+        searcher = EntitySearcher(model_name=model_name, index_path=index_name, cache_size=0, hybrid=hybrid)
+        searcher.prepare_index(Document(doc_name=doc_name, type=doc_type).paragraphs(pages=True))
+        # Both modes pay for embedding their queries, but not for loading the model.
+        get_encoder(model_name).load()
+        get_encoder(model_name).clear_cache()
+        latencies, search = [], searcher.search_entity
+
+        def timed_search(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return search(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        searcher.search_entity = timed_search
+        agent = ReActDocumentQA(None, index_name=index_name, searcher=searcher)
+        for question in questions:
+            agent.process_question(question)
+        iterations = [usage["iterations"] for usage in agent.usage]
+        rows["hybrid" if hybrid else "dense"] = (np.mean(iterations), len(latencies) / len(questions), latencies)
+
+    print(f"{'mode':<8} {'iterations':>10} {'searches':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, (iterations, searches, latencies) in rows.items():
+        print(f"{mode:<8} {iterations:>10.2f} {searches:>9.2f} {percentiles(latencies) if latencies else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--doc", help="document in DOC_PATH to run the agent on")
+    parser.add_argument("--type", default="PDF")
+    parser.add_argument("--questions", help="JSON file with a list of questions about --doc")
+    args = parser.parse_args()
+
+    if args.doc and args.questions:
+        with open(args.questions) as f:
+            eval_agent(args.model, args.doc, args.type, json.load(f))
+        return
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        os.environ["INDEX_DIR"] = index_dir
+        eval_retrieval(args.model, args.paragraphs, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Offline stand-ins for the OpenAI client, passed to the agents as `client`.
+
+`ScriptedLLM` plays a ReAct policy over known question facts, `ReplayLLM`
+answers from completions recorded in a `ResponseCache`. Both mimic
+`client.chat.completions.create` and the response fields the agents read,
+including `stream=True` chunks.
+"""
+import re
+import time
+import random
+import asyncio
+from types import SimpleNamespace
+
+# Project level imports.
+from utils.llm_cache import ResponseCache, CacheMiss
+
+TAIL = re.compile(r"(Thought|Action) (\d+):$")
+# Action lines as models sometimes write them, for `ScriptedLLM(malformed=...)`.
+MALFORMED = (
+    "\nAction {n}:{action}",
+    "\naction {n}: {action_lower}",
+    "\n**Action {n}:** {action}",
+    " Action: {action}",
+    "\nAction {n}: {action}\nThought {next}: That should tell me more about it.",
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def completion(request: dict, content: str) -> SimpleNamespace:
+    """
+    A chat completion response carrying `content`, with estimated usage.
+    """
+    prompt = "".join(message["content"] for message in request["messages"])
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(content),
+                              prompt_tokens_details=None),
+    )
+
+
+def stream_pieces(content: str) -> list:
+    """
+    `content` split the way it is streamed: one word per chunk.
+    """
+    return re.findall(r"\s*\S+|\s+$", content) or [""]
+
+
+def chunk(piece: str = None, usage=None) -> SimpleNamespace:
+    """
+    A streamed completion chunk carrying `piece`, or only `usage`.
+    """
+    if piece is None:
+        return SimpleNamespace(choices=[], usage=usage)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=None)],
+                           usage=None)
+
+
+def apply_stop(request: dict, content: str) -> str:
+    for stop in request.get("stop") or []:
+        if stop in content:
+            content = content[:content.find(stop)]
+    return content
+
+
+def stream_chunks(request: dict, content: str, token_latency: float = 0.0):
+    """
+    Chunks of `content`, one every `token_latency` seconds, then the usage
+    chunk when asked for with `stream_options`.
+    """
+    for piece in stream_pieces(content):
+        if token_latency:
+            time.sleep(token_latency)
+        yield chunk(piece)
+    if (request.get("stream_options") or {}).get("include_usage"):
+        yield chunk(usage=completion(request, content).usage)
+
+
+class AsyncStream:
+    """
+    Async counterpart of `stream_chunks`, closed like the OpenAI stream.
+    """
+
+    def __init__(self, request: dict, content: str, latency: float = 0.0, token_latency: float = 0.0):
+        self.__chunks = self.__generate(request, content, latency, token_latency)
+
+    async def __generate(self, request, content, latency, token_latency):
+        if latency:
+            await asyncio.sleep(latency)
+        for piece in stream_pieces(content):
+            if token_latency:
+                await asyncio.sleep(token_latency)
+            yield chunk(piece)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            yield chunk(usage=completion(request, content).usage)
+
+    def __aiter__(self):
+        return self.__chunks
+
+    async def close(self) -> None:
+        await self.__chunks.aclose()
+
+
+def unstreamed(request: dict) -> dict:
+    """
+    `request` without its streaming options, as the agents cache it.
+    """
+    return {key: value for key, value in request.items() if key not in ("stream", "stream_options")}
+
+
+class ScriptedLLM:
+    """
+    Deterministic ReAct policy. For a question in `facts`, mapping it to a
+    (keyword, answer) pair, it searches the keyword, looks it up again up to
+    `max_lookups` times while the answer is not in the last observation, and
+    finishes with the answer once it is (or "unknown" when it never shows
+    up). Unknown questions are searched verbatim.
+
+    Like a remote model, every call waits `latency` seconds before its first
+    token and `token_latency` per streamed word, and cuts its completion at
+    the request's stop sequences. A `malformed` fraction of the Action lines
+    (picked deterministically per question and step) comes out in one of
+    the `MALFORMED` shapes instead of "Action N: ...".
+    """
+
+    def __init__(self, facts: dict, latency: float = 0.0, max_lookups: int = 2, token_latency: float = 0.0,
+                 malformed: float = 0.0, seed: int = 0):
+        self.facts = facts
+        self.latency = latency
+        self.max_lookups = max_lookups
+        self.token_latency = token_latency
+        self.malformed = malformed
+        self.seed = seed
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def next_action(self, question: str, iteration: int, observation: str) -> str:
+        keyword, answer = self.facts.get(question, (question, None))
+        if iteration == 1:
+            return f"Search[{keyword}]"
+        if answer is not None and answer.lower() in observation.lower():
+            return f"Finish[{answer}]"
+        if iteration <= self.max_lookups + 1:
+            return f"Lookup[{keyword}]"
+        return "Finish[unknown]"
+
+    def complete(self, messages: list) -> str:
+        """
+        Continue the scratchpad of the last message, which ends in either
+        "Thought N:" or "Action N:".
+        """
+        prompt = messages[-1]["content"]
+        question = prompt[prompt.rfind("Question: ") + len("Question: "):].split("\n", 1)[0]
+        tail = TAIL.search(prompt)
+        kind, iteration = tail.group(1), int(tail.group(2))
+        start = prompt.rfind("\nObservation ")
+        observation = prompt[start:tail.start()] if start >= 0 else ""
+        action = self.next_action(question, iteration, observation)
+        if kind == "Action":
+            return f" {action}"
+        thought = "I need to search for it." if iteration == 1 else "Let me check what I found."
+        line = "\nAction {n}: {action}"
+        if self.malformed and random.Random(f"{self.seed}:{question}:{iteration}").random() < self.malformed:
+            line = random.Random(f"{self.seed}:{question}:{iteration}:shape").choice(MALFORMED)
+        return f" {thought}" + line.format(n=iteration, next=iteration + 1, action=action,
+                                            action_lower=action[0].lower() + action[1:])
+
+    def create(self, **request):
+        self.calls += 1
+        content = apply_stop(request, self.complete(request["messages"]))
+        if request.get("stream"):
+            if self.latency:
+                time.sleep(self.latency)
+            return stream_chunks(request, content, self.token_latency)
+        time.sleep(self.latency + self.token_latency * len(stream_pieces(content)))
+        return completion(request, content)
+
+
+class AsyncScriptedLLM(ScriptedLLM):
+    """
+    `ScriptedLLM` for the async agent; waiting does not block the loop.
+    """
+
+    async def create(self, **request):
+        self.calls += 1
+        content = apply_stop(request, self.complete(request["messages"]))
+        if request.get("stream"):
+            return AsyncStream(request, content, self.latency, self.token_latency)
+        await asyncio.sleep(self.latency + self.token_latency * len(stream_pieces(content)))
+        return completion(request, content)
+
+
+class ReplayLLM:
+    """
+    Answers from a `ResponseCache` recorded by an agent run against the real
+    model, as written with LLM_CACHE_PATH set. Requests have to match the
+    recording byte for byte; a miss raises `CacheMiss`.
+    """
+
+    def __init__(self, path: str, latency: float = 0.0):
+        self.__cache = ResponseCache(path, read_only=True)
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def lookup(self, request: dict) -> str:
+        self.calls += 1
+        cached = self.__cache.get(unstreamed(request))
+        if cached is None:
+            raise CacheMiss("LLM request not found in the recording.")
+        return cached["content"]
+
+    def create(self, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        content = self.lookup(request)
+        if request.get("stream"):
+            return stream_chunks(request, content)
+        return completion(request, content)
+
+
+class AsyncReplayLLM(ReplayLLM):
+    async def create(self, **request):
+        content = self.lookup(request)
+        if request.get("stream"):
+            return AsyncStream(request, content, self.latency)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return completion(request, content)
@@ -1,21 +1,46 @@
 import json
+import asyncio
+from contextlib import contextmanager
 
 # Project level libraries.
 from utils.document import Document
-from agentqa import ReActDocumentQA
+from agentqa import ReActDocumentQA, AsyncReActDocumentQA
+from utils.corpus import CorpusSearcher
+from utils.llm import TokenBucket
+from utils import tracing
 
-def run_app(doc_name, doc_type, questions):
+@contextmanager
+def batch_trace():
+    """
+    When tracing is enabled, collect the spans of a batch and print the
+    per-stage p50/p95 latencies and token totals once it is done.
+    """
+    if not tracing.enabled():
+        yield
+        return
+    sink = tracing.MemorySink()
+    tracing.add_sink(sink)
+    try:
+        yield
+    finally:
+        tracing.remove_sink(sink)
+        print(tracing.format_summary(sink.spans))
+
+def run_app(doc_name, doc_type, questions, requests_per_second=None):
     # Create document object
     obj = Document(doc_name=doc_name, type=doc_type)
-    document = obj.document
+    # Paragraphs are streamed into the index, never held as one string.
+    document = obj.paragraphs(pages=True)
     
     # Initialize agent
     index_name = doc_name[:doc_name.find('.')]
-    agent = ReActDocumentQA(document, index_name=index_name)
+    rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    agent = ReActDocumentQA(document, index_name=index_name, rate_limiter=rate_limiter)
     
     answers = []
-    for question in questions:
-        answers.append(agent.process_question(question))
+    with batch_trace():
+        for question in questions:
+            answers.append(agent.process_question(question))
     
     result = json.dumps({
         'questions': questions,
@@ -23,6 +48,52 @@ def run_app(doc_name, doc_type, questions):
     })
     return result
 
+async def arun_app(doc_name, doc_type, questions, concurrency=8, requests_per_second=None):
+    """
+    Async `run_app`: answers up to `concurrency` questions at a time, with
+    LLM requests optionally limited to `requests_per_second`.
+    """
+    obj = Document(doc_name=doc_name, type=doc_type)
+    document = obj.paragraphs(pages=True)
+
+    index_name = doc_name[:doc_name.find('.')]
+    rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    agent = AsyncReActDocumentQA(document, index_name=index_name, rate_limiter=rate_limiter)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question):
+        async with semaphore:
+            return await agent.aprocess_question(question)
+
+    with batch_trace():
+        answers = await asyncio.gather(*(answer(question) for question in questions))
+
+    result = json.dumps({
+        'questions': questions,
+        'answers': list(answers)
+    })
+    return result
+
+def run_corpus_app(files, questions, documents=None, index_name="corpus"):
+    """
+    Answer questions across many (doc_name, doc_type) files sharing one index.
+    `documents` optionally restricts every question to some doc_names.
+    """
+    searcher = CorpusSearcher(index_path=index_name)
+    searcher.ingest(files)
+    agent = ReActDocumentQA(None, index_name=index_name, searcher=searcher)
+
+    answers = []
+    for question in questions:
+        answers.append(agent.process_question(question, documents=documents))
+
+    result = json.dumps({
+        'questions': questions,
+        'answers': answers
+    })
+    return result
+
 if __name__ == "__main__":
     
     #document_name = 'lily_story.txt'
@@ -0,0 +1,76 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeSearcher:
+    """
+    Keyword searcher standing in for `EntitySearcher`; records its queries.
+    """
+
+    def __init__(self, paragraphs: list = None, **kwargs):
+        self.paragraphs = list(paragraphs or [])
+        self.queries = []
+
+    def prepare_index(self, document) -> None:
+        items = document.split("\n") if isinstance(document, str) else document
+        self.paragraphs += [item if isinstance(item, str) else item[-1] for item in items]
+
+    def search_entity(self, query: str, top_k: int = 3, documents: list = None) -> list:
+        self.queries.append(query)
+        words = query.lower().split()
+        return [(p, 1.0) for p in self.paragraphs if any(word in p.lower() for word in words)][:top_k]
+
+
+class NoLLM:
+    """
+    Client that fails every call, for runs that must be served from a cache.
+    """
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    def create(self, **request):
+        raise AssertionError("Unexpected LLM call.")
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory) -> str:
+    """
+    Path of a tiny randomly initialized BERT with its own word-piece vocab,
+    built offline: fast enough to embed in tests, not to search well.
+    """
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    path = tmp_path_factory.mktemp("tiny_model")
+    words = ("the a river village lion lions forest morning pond friend journey light stone market king queen "
+             "ship storm garden mountain letter school teacher city bridge winter summer live in africa asia "
+             "tigers keeps near every what does keep").split()
+    vocab = (["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + list("abcdefghijklmnopqrstuvwxyz0123456789.,?!:;'\"-")
+             + [f"##{c}" for c in "abcdefghijklmnopqrstuvwxyz0123456789"] + sorted(set(words)))
+    (path / "vocab.txt").write_text("\n".join(vocab))
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64)
+    BertModel(config).save_pretrained(path)
+    BertTokenizerFast(vocab_file=str(path / "vocab.txt")).save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch) -> str:
+    monkeypatch.setenv("INDEX_DIR", str(tmp_path))
+    monkeypatch.setenv("HF_HUB_OFFLINE", "1")
+    return str(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def offline_env(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL", "gpt-4o-mini")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    monkeypatch.delenv("REACT_SPECULATIVE", raising=False)
@@ -0,0 +1,120 @@
+"""
+Local HTTP server speaking enough of the OpenAI chat completions API for the
+agents' real `OpenAI`/`AsyncOpenAI` clients, answering with a `ScriptedLLM`.
+Point the clients at it with OPENAI_BASE_URL set to `server.base_url`.
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Project level imports.
+from benchmarks.fake_llm import apply_stop, completion, stream_pieces
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def __send(self, status: int, payload: dict, headers: dict = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __stream(self, request: dict, content: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": request["model"]}
+        for piece in stream_pieces(content):
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage = completion(request, content).usage
+            chunk = dict(base, choices=[], usage={"prompt_tokens": usage.prompt_tokens,
+                                                  "completion_tokens": usage.completion_tokens,
+                                                  "total_tokens": usage.prompt_tokens + usage.completion_tokens})
+            self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def do_POST(self):
+        server = self.server.fake
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        failure = server.begin()
+        try:
+            if failure:
+                self.__send(failure, {"error": {"message": f"Injected {failure}.", "type": "fake"}},
+                            {"retry-after": str(server.retry_after)})
+                return
+            if server.latency:
+                time.sleep(server.latency)
+            content = apply_stop(request, server.llm.complete(request["messages"]))
+            if request.get("stream"):
+                self.__stream(request, content)
+                return
+            usage = completion(request, content).usage
+            self.__send(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                          "total_tokens": usage.prompt_tokens + usage.completion_tokens},
+            })
+        finally:
+            server.end()
+
+
+class FakeOpenAIServer:
+    """
+    Serves `llm` on localhost. The first requests fail with the statuses in
+    `failures` (e.g. 429, 503) and a Retry-After of `retry_after` seconds;
+    every other request waits `latency` seconds. `requests` holds the
+    (arrival time, status) of each request and `max_in_flight` the most
+    requests handled at once.
+    """
+
+    def __init__(self, llm, failures=(), latency: float = 0.0, retry_after: float = 0.01):
+        self.llm = llm
+        self.latency = latency
+        self.retry_after = retry_after
+        self.requests = []
+        self.max_in_flight = 0
+        self.__failures = list(failures)
+        self.__in_flight = 0
+        self.__lock = threading.Lock()
+        self.__server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.__server.server_address[1]}/v1"
+
+    def begin(self) -> int:
+        """
+        Count a request in; returns the status it has to fail with, or 0.
+        """
+        with self.__lock:
+            failure = self.__failures.pop(0) if self.__failures else 0
+            self.requests.append((time.monotonic(), failure or 200))
+            self.__in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.__in_flight)
+            return failure
+
+    def end(self) -> None:
+        with self.__lock:
+            self.__in_flight -= 1
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.__server.daemon_threads = True
+        self.__server.fake = self
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
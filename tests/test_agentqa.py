@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import pytest
+
+from agentqa import PREFETCH_WORKERS, ReActDocumentQA, AsyncReActDocumentQA
+from benchmarks import fake_llm
+from benchmarks.fake_llm import ScriptedLLM
+from utils.llm_cache import ResponseCache, CacheMiss
+from tests.conftest import FakeSearcher, NoLLM
+
+QUESTION = "What does Velmitra Dorsel keep?"
+FACTS = {QUESTION: ("Velmitra Dorsel", "kazor")}
+PARAGRAPHS = ["Velmitra Dorsel keeps the kazor near the river.", "The lion sleeps by the pond."]
+
+
+def test_speculative_recording_replays_in_serial(tmp_path, monkeypatch):
+    # Every step runs on past its Action line, so the speculative loop drops the rest of each stream.
+    monkeypatch.setattr(fake_llm, "MALFORMED", (fake_llm.MALFORMED[-1],))
+    path = str(tmp_path / "cache.sqlite")
+
+    llm = ScriptedLLM(FACTS, malformed=1.0)
+    recorder = ReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS), client=llm,
+                               cache=ResponseCache(path), speculative=True)
+    assert recorder.process_question(QUESTION) == "kazor"
+    assert llm.calls == 2
+
+    searcher = FakeSearcher(PARAGRAPHS)
+    replayer = ReActDocumentQA(None, index_name="test", searcher=searcher, client=NoLLM(),
+                               cache=ResponseCache(path, read_only=True), speculative=False)
+    assert replayer.process_question(QUESTION) == "kazor"
+    assert searcher.queries == ["velmitra dorsel"]
+    assert replayer.usage[0]["cache_hits"] == 2
+
+
+def test_read_only_cache_miss_fails_loudly(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(path)
+    agent = ReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS), client=NoLLM(),
+                            cache=ResponseCache(path, read_only=True))
+    with pytest.raises(CacheMiss):
+        agent.process_question(QUESTION)
+
+
+def test_read_only_cache_miss_fails_loudly_async(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(path)
+    agent = AsyncReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS), client=NoLLM(),
+                                 cache=ResponseCache(path, read_only=True))
+    with pytest.raises(CacheMiss):
+        asyncio.run(agent.aprocess_question(QUESTION))
+
+
+def test_usage_counts_iterations_not_llm_calls(monkeypatch):
+    # The Action shares the Thought's line, so each step takes an extra Action-only call.
+    monkeypatch.setattr(fake_llm, "MALFORMED", (" Action: {action}",))
+    agent = ReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS),
+                            client=ScriptedLLM(FACTS, malformed=1.0))
+    assert agent.process_question(QUESTION) == "kazor"
+    assert agent.usage[0]["iterations"] == 2
+    assert agent.usage[0]["llm_calls"] == 4
+
+
+@pytest.mark.parametrize("value, speculative", [("1", True), ("true", True), ("Yes", True), ("0", False),
+                                                ("false", False), ("", False)])
+def test_react_speculative_env(monkeypatch, value, speculative):
+    monkeypatch.setenv("REACT_SPECULATIVE", value)
+    agent = ReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS), client=NoLLM())
+    assert agent._speculative is speculative
+
+
+def test_speculative_agents_share_one_prefetch_executor():
+    threads = lambda: {thread for thread in threading.enumerate() if thread.name.startswith("prefetch")}
+    agent = ReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS),
+                            client=ScriptedLLM(FACTS), speculative=True)
+    assert agent.process_question(QUESTION) == "kazor"
+    for _ in range(20):
+        other = ReActDocumentQA(None, index_name="test", searcher=FakeSearcher(PARAGRAPHS),
+                                client=ScriptedLLM(FACTS), speculative=True)
+        assert other.process_question(QUESTION) == "kazor"
+        assert other._prefetcher is agent._prefetcher
+    # Each agent used to start threads of its own that were never shut down.
+    assert len(threads()) <= PREFETCH_WORKERS
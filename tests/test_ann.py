@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from utils.ann import IndexSpec
+
+
+@pytest.mark.parametrize("spec", ["ivfpq", "ivfpq:nlist=64", "ivf:nlist=64"])
+@pytest.mark.parametrize("n_vectors", [1, 5, 255])
+def test_trained_indexes_build_from_few_vectors(spec, n_vectors):
+    vectors = np.random.default_rng(0).standard_normal((n_vectors, 32)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = IndexSpec.parse(spec).build(vectors, np.arange(n_vectors, dtype="int64"))
+    assert index.ntotal == n_vectors
+    assert index.search(vectors[-1:], 1)[1][0, 0] == n_vectors - 1
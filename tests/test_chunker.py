@@ -0,0 +1,19 @@
+import pytest
+
+from utils.chunker import is_heading, split_paragraphs
+
+
+@pytest.mark.parametrize("paragraph", ['"What could it lead to?"', "“Let us go home together!”",
+                                       "'Fine,' she said.", "(See the map.)"])
+def test_quoted_dialogue_is_not_a_heading(paragraph):
+    assert not is_heading(paragraph)
+
+
+@pytest.mark.parametrize("paragraph", ["Chapter One", '"The Secret Map"', "# Introduction"])
+def test_headings(paragraph):
+    assert is_heading(paragraph)
+
+
+def test_split_paragraphs_of_text_and_line_streams():
+    assert list(split_paragraphs("  Lions. \n\n\tTigers.\n ")) == ["Lions.", "Tigers."]
+    assert list(split_paragraphs(iter(["  Lions. ", "", "Tigers."]))) == ["Lions.", "Tigers."]
@@ -0,0 +1,43 @@
+import pytest
+
+from utils.corpus import CorpusSearcher
+
+DOCUMENTS = {
+    f"doc_{i}": f"Story {i} begins in the village.\nThe lantern {i} lights the bridge at night."
+    for i in range(6)
+}
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupted_after(documents: dict, count: int):
+    for i, item in enumerate(documents.items()):
+        if i == count:
+            raise Interrupted()
+        yield item
+
+
+def test_streamed_documents_are_saved_as_they_are_added(tiny_model, index_dir):
+    searcher = CorpusSearcher(model_name=tiny_model, index_spec="auto:auto_threshold=4", hybrid=False)
+    with pytest.raises(Interrupted):
+        searcher.add_documents(interrupted_after(DOCUMENTS, 5), save_every=2)
+
+    # The first two documents were pooled into the initial build and saved,
+    # the next two were streamed in and saved; the fifth was not saved yet.
+    assert sorted(CorpusSearcher(model_name=tiny_model, index_spec="auto:auto_threshold=4").documents) == \
+        ["doc_0", "doc_1", "doc_2", "doc_3"]
+
+
+def test_streamed_and_pooled_documents_match_a_one_pass_build(tiny_model, index_dir):
+    streamed = CorpusSearcher(model_name=tiny_model, index_path="streamed", index_spec="auto:auto_threshold=4")
+    streamed.add_documents(iter(DOCUMENTS.items()), save_every=3)
+    pooled = CorpusSearcher(model_name=tiny_model, index_path="pooled")
+    pooled.add_documents(DOCUMENTS)
+
+    reloaded = CorpusSearcher(model_name=tiny_model, index_path="streamed")
+    assert sorted(reloaded.documents) == sorted(DOCUMENTS)
+    for query in ("lantern 3", "story 5 village"):
+        assert reloaded.search(query, top_k=2) == pooled.search(query, top_k=2)
+    assert reloaded.search("lantern", documents=["doc_4"])[0][2] == "doc_4"
@@ -0,0 +1,64 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from utils.chunker import Chunker
+from utils.encoder import Encoder
+
+WORDS = "the river village lion forest morning pond friend journey light stone market king queen".split()
+
+
+def texts(seed: int) -> list:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 60))) for _ in range(rng.randint(1, 12))]
+
+
+def test_concurrent_embeds_and_chunking_share_the_tokenizer(tiny_model, index_dir):
+    encoder = Encoder(tiny_model)
+    chunker = Chunker(max_tokens=64, target_tokens=32, overlap_tokens=4)
+
+    def work(seed: int):
+        batch = texts(seed)
+        if seed % 3 == 0:
+            return len(list(chunker.chunk(batch, encoder.tokenizer)))
+        return encoder.embed(batch, batch_size=4).shape[0] == len(batch)
+
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(work, range(400)))
+    assert all(results)
+
+    # Embeddings do not depend on what other threads tokenized meanwhile.
+    batch = texts(1)
+    assert np.allclose(encoder.embed(batch, batch_size=4), Encoder(tiny_model).embed(batch, batch_size=4), atol=1e-5)
+
+
+@pytest.fixture(params=["tiny", "sentence-transformers/all-MiniLM-L6-v2"])
+def parity_model(request, tiny_model) -> str:
+    """
+    The tiny test model, and the default model when it is cached locally.
+    """
+    if request.param == "tiny":
+        return tiny_model
+    from transformers import AutoConfig
+    try:
+        AutoConfig.from_pretrained(request.param, local_files_only=True)
+    except OSError:
+        pytest.skip(f"{request.param} is not cached locally.")
+    return request.param
+
+
+@pytest.mark.parametrize("backend", ["onnx", "torch-int8", "onnx-int8"])
+def test_backend_matches_torch(backend, parity_model, index_dir, tmp_path, monkeypatch):
+    from benchmarks.bench_encoder import MIN_COSINE
+
+    if backend.startswith("onnx"):
+        pytest.importorskip("onnxruntime")
+    monkeypatch.setenv("ENCODER_CACHE_DIR", str(tmp_path / "onnx"))
+    batch = [text for seed in range(8) for text in texts(seed)]
+    expected = Encoder(parity_model).embed(batch, batch_size=8)
+    embeddings = Encoder(parity_model, backend=backend).embed(batch, batch_size=8)
+    cosines = (expected * embeddings).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(embeddings, axis=1))
+    assert cosines.min() >= MIN_COSINE[backend]
@@ -0,0 +1,184 @@
+import math
+import random
+from collections import Counter
+
+import numpy as np
+
+from utils.bm25 import BM25Index, tokenize
+from utils.index_store import IndexStore
+from utils.paragraph_store import ParagraphStore
+
+DOCUMENT = "Lions live in Africa.\nTigers live in Asia."
+
+
+def embed(texts: list) -> np.ndarray:
+    rng = np.random.default_rng(len(texts))
+    vectors = rng.standard_normal((len(texts), 8)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(path: str, backend: str) -> IndexStore:
+    store = IndexStore(path, "model", "flat", backend=backend)
+    store.load()
+    store.sync({"doc": DOCUMENT}, lambda text: text.split("\n"), embed)
+    store.save()
+    return store
+
+
+def test_index_is_rebuilt_for_another_encoder_backend(tmp_path):
+    path = str(tmp_path / "index")
+    build(path, "torch")
+    assert IndexStore(path, "model", "flat", backend="torch").load()
+    assert not IndexStore(path, "model", "flat", backend="onnx-int8").load()
+
+
+def test_query_is_normalized_and_cached_per_version(tmp_path):
+    from utils.lru_cache import LRUCache
+
+    store = build(str(tmp_path / "index"), "torch")
+    cache, queries = LRUCache(), []
+
+    def embed_query(query: str) -> np.ndarray:
+        queries.append(query)
+        return embed([query])
+
+    first = store.query("  Lions ", embed_query, 1, cache=cache)
+    assert store.query("lions", embed_query, 1, cache=cache) == first
+    assert queries == ["lions"]
+
+    store.sync({"doc": DOCUMENT + "\nBears live in forests."}, lambda text: text.split("\n"), embed)
+    store.query("lions", embed_query, 1, cache=cache)
+    assert queries == ["lions", "lions"]
+
+
+class CountingEmbed:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts: list) -> np.ndarray:
+        self.texts.extend(texts)
+        return embed(texts)
+
+
+def live(store: IndexStore) -> list:
+    return sorted(paragraph for paragraph in store.paragraphs if paragraph is not None)
+
+
+def test_sync_embeds_only_new_paragraphs_and_removes_stale_ones(tmp_path):
+    path = str(tmp_path / "index")
+    store = build(path, "torch")
+    counting = CountingEmbed()
+    lines = lambda text: text.split("\n")
+
+    store.sync({"doc": "Lions live in Africa.\nBears live in forests.",
+                "other": "Owls hunt at night."}, lines, counting)
+    assert counting.texts == ["Bears live in forests.", "Owls hunt at night."]
+    assert store.index.ntotal == 3
+    assert live(store) == ["Bears live in forests.", "Lions live in Africa.", "Owls hunt at night."]
+    assert [idx for idx, _ in store.search(embed(["x"]), 5, documents=["other"])] == [3]
+
+    store.sync({"doc": None}, lines, counting)
+    store.save()
+    reloaded = IndexStore(path, "model", "flat")
+    assert reloaded.load()
+    assert reloaded.documents == ["other"]
+    assert reloaded.index.ntotal == 1
+    assert live(reloaded) == ["Owls hunt at night."]
+    assert reloaded.is_current("other", "Owls hunt at night.")
+
+
+def test_sync_stream_appends_in_batches_and_removes_missing_paragraphs(tmp_path):
+    path = str(tmp_path / "index")
+    store = build(path, "torch")
+    counting = CountingEmbed()
+    paragraphs = ["Lions live in Africa.", "Bears live in forests.", "Owls hunt at night.", "Fish swim."]
+
+    assert store.sync_stream("doc", iter(paragraphs), lambda stream: stream, counting, batch_size=2)
+    assert counting.texts == paragraphs[1:]
+    assert live(store) == sorted(paragraphs)
+    assert store.is_current("doc", "\n".join(paragraphs))
+    assert not store.sync_stream("doc", iter(paragraphs), lambda stream: stream, counting, batch_size=2)
+
+    assert store.sync_stream("doc", iter(paragraphs[2:]), lambda stream: stream, counting, batch_size=2)
+    assert counting.texts == paragraphs[1:]
+    store.save()
+    reloaded = IndexStore(path, "model", "flat")
+    assert reloaded.load()
+    assert reloaded.index.ntotal == 2
+    assert live(reloaded) == sorted(paragraphs[2:])
+    assert sorted(idx for idx, _ in reloaded.search(embed(["x"]), 5)) == [3, 4]
+
+
+def test_paragraph_store_keeps_ids_across_changes_and_reloads(tmp_path):
+    path = str(tmp_path / "paragraphs")
+    store = ParagraphStore(path)
+    assert not store.exists() and len(store) == 0
+    assert [store.append(text) for text in ["Lions.", "Tigers üñ.", "Bears."]] == [0, 1, 2]
+    store.save()
+
+    store = ParagraphStore(path)
+    assert list(store) == ["Lions.", "Tigers üñ.", "Bears."]
+    store.remove(0)
+    store.replace(2, "Brown bears.")
+    assert store.append("Owls.") == 3
+    assert store.changed
+    assert list(store) == [None, "Tigers üñ.", "Brown bears.", "Owls."]
+    store.save()
+    assert not store.changed
+
+    reloaded = ParagraphStore(path)
+    assert list(reloaded) == [None, "Tigers üñ.", "Brown bears.", "Owls."]
+    assert reloaded.append("Fish.") == 4
+    reloaded.close()
+    assert list(ParagraphStore(path)) == [None, "Tigers üñ.", "Brown bears.", "Owls."]
+
+
+def brute_force_bm25(texts: dict, query: str, k1: float = 1.2, b: float = 0.75) -> dict:
+    counts = {idx: Counter(tokenize(text)) for idx, text in texts.items()}
+    avg_length = sum(sum(c.values()) for c in counts.values()) / len(counts)
+    scores = {}
+    for term in set(tokenize(query)):
+        matching = [idx for idx, c in counts.items() if term in c]
+        idf = math.log(1 + (len(counts) - len(matching) + 0.5) / (len(matching) + 0.5))
+        for idx in matching:
+            tf, length = counts[idx][term], sum(counts[idx].values())
+            scores[idx] = scores.get(idx, 0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+    return scores
+
+
+def assert_matches_brute_force(index: BM25Index, texts: dict, queries: list) -> None:
+    for query in queries:
+        expected = brute_force_bm25(texts, query)
+        results = index.search(query, len(texts))
+        assert {idx for idx, _ in results} == set(expected)
+        for idx, score in results:
+            assert math.isclose(score, expected[idx], rel_tol=1e-5)
+        assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_bm25_merges_removes_and_reloads_like_brute_force(tmp_path):
+    rng = random.Random(0)
+    words = "lion tiger river village king queen map 1871 storm bridge".split()
+    texts = {idx: " ".join(rng.choice(words) for _ in range(rng.randint(1, 12))) for idx in range(60)}
+    queries = ["lion", "river king", "1871 storm", "Queen map bridge", "unknown"]
+
+    index = BM25Index(str(tmp_path / "index.bm25"))
+    index.add(range(30), [texts[idx] for idx in range(30)])
+    assert_matches_brute_force(index, {idx: texts[idx] for idx in range(30)}, queries)
+    index.add(range(30, 60), [texts[idx] for idx in range(30, 60)])
+    removed = set(range(0, 60, 7))
+    index.remove(removed)
+    kept = {idx: text for idx, text in texts.items() if idx not in removed}
+    assert len(index) == len(kept)
+    assert_matches_brute_force(index, kept, queries)
+    assert index.search("lion", 3, ranges=[(10, 20)]) == [
+        (idx, score) for idx, score in index.search("lion", 60) if 10 <= idx < 20][:3]
+
+    index.save()
+    reloaded = BM25Index(str(tmp_path / "index.bm25"))
+    assert reloaded.load()
+    assert_matches_brute_force(reloaded, kept, queries)
+    reloaded.add([60], ["lion lion river"])
+    reloaded.remove([1])
+    kept = {**{idx: text for idx, text in kept.items() if idx != 1}, 60: "lion lion river"}
+    assert_matches_brute_force(reloaded, kept, queries)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import pytest
+
+import agentqa
+from agentqa import ReActDocumentQA
+from benchmarks.fake_llm import ScriptedLLM
+from main import arun_app, run_app
+from utils import tracing
+from utils.document import Document
+from tests.conftest import FakeSearcher
+from tests.fake_openai import FakeOpenAIServer
+
+FACTS = {
+    "What does Velmitra Dorsel keep?": ("Velmitra Dorsel", "kazor"),
+    "What does Quinra Fenlo keep?": ("Quinra Fenlo", "bekthu"),
+    "What does Osgri Naimi keep?": ("Osgri Naimi", "tralo"),
+    "What does Selzor Kamira keep?": ("Selzor Kamira", "vel"),
+}
+PARAGRAPHS = [f"{entity} keeps the {answer} near the river." for entity, answer in FACTS.values()]
+
+
+@pytest.fixture
+def document(tmp_path, monkeypatch):
+    """
+    A TXT document of the facts, indexed by a `FakeSearcher`.
+    """
+    (tmp_path / "facts.txt").write_text("\n\n".join(PARAGRAPHS))
+    monkeypatch.setattr(Document, "doc_path", str(tmp_path))
+    monkeypatch.setattr(agentqa, "EntitySearcher", FakeSearcher)
+    return "facts.txt"
+
+
+@pytest.fixture
+def spans():
+    sink = tracing.MemorySink()
+    tracing.add_sink(sink)
+    yield sink.spans
+    tracing.remove_sink(sink)
+
+
+def answers(result: str) -> list:
+    return json.loads(result)["answers"]
+
+
+def test_sync_agent_retries_rate_limits_and_server_errors(monkeypatch, spans):
+    with FakeOpenAIServer(ScriptedLLM(FACTS), failures=[429, 500]) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        agent = ReActDocumentQA(None, index_name="facts", searcher=FakeSearcher(PARAGRAPHS))
+        assert agent.process_question("What does Velmitra Dorsel keep?") == "kazor"
+
+    # Each failure is retried once by call_with_retry, none by the SDK.
+    assert [status for _, status in server.requests] == [429, 500, 200, 200]
+    assert sum(span["attrs"].get("retries", 0) for span in spans) == 2
+
+
+def test_arun_app_answers_concurrently_through_failures(document, monkeypatch):
+    with FakeOpenAIServer(ScriptedLLM(FACTS), failures=[429, 503, 429], latency=0.1) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        result = asyncio.run(arun_app(document, "TXT", list(FACTS), concurrency=4))
+
+    assert answers(result) == [answer for _, answer in FACTS.values()]
+    assert [status for _, status in server.requests].count(200) == 2 * len(FACTS)
+    assert server.max_in_flight > 1
+
+
+def test_arun_app_respects_requests_per_second(document, monkeypatch):
+    rate = 4
+    with FakeOpenAIServer(ScriptedLLM(FACTS), failures=[429, 429]) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        result = asyncio.run(arun_app(document, "TXT", list(FACTS), concurrency=4, requests_per_second=rate))
+
+    assert answers(result) == [answer for _, answer in FACTS.values()]
+    # A full bucket allows a burst of `rate` requests; every other request, retries included, waits its turn.
+    times = [arrival for arrival, _ in server.requests]
+    assert len(times) == 2 * len(FACTS) + 2
+    assert times[-1] - times[0] >= 0.9 * (len(times) - rate) / rate
+
+
+def test_run_app_respects_requests_per_second(document, monkeypatch):
+    rate = 2
+    with FakeOpenAIServer(ScriptedLLM(FACTS), failures=[429]) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        result = run_app(document, "TXT", list(FACTS)[:2], requests_per_second=rate)
+
+    assert answers(result) == [answer for _, answer in list(FACTS.values())[:2]]
+    times = [arrival for arrival, _ in server.requests]
+    assert len(times) == 2 * 2 + 1
+    assert times[-1] - times[0] >= 0.9 * (len(times) - rate) / rate
@@ -0,0 +1,54 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.search_service import SearchService
+from utils.searcher import EntitySearcher
+
+PARAGRAPHS = ["Lions live in Africa.", "Tigers live in Asia.", "The king keeps a map near the river."]
+
+
+def test_service_searches_locally_with_embedding_server_set(tiny_model, index_dir, monkeypatch):
+    # The service reads the same .env as its clients, which point at the service.
+    monkeypatch.setenv("EMBEDDING_SERVER", "unix:///nonexistent/search.sock")
+    service = SearchService(tiny_model)
+    service.prepare("a", PARAGRAPHS)
+    assert "Tigers live in Asia." in service.search("a", "tigers", top_k=1)[0][0]
+    # A second service loads the saved index instead of preparing it.
+    assert "Tigers live in Asia." in SearchService(tiny_model).search("a", "tigers", top_k=1)[0][0]
+
+
+def test_remote_searcher_has_no_local_index_to_load(index_dir):
+    assert EntitySearcher(index_path="a", server="unix:///nonexistent/search.sock").load_index()
+
+
+def test_prepare_runs_while_other_indexes_are_searched(tiny_model, index_dir):
+    service = SearchService(tiny_model, max_wait_ms=0.5)
+    service.prepare("a", PARAGRAPHS)
+    words = "the river village lion forest morning pond friend journey light stone market king queen".split()
+    document = [" ".join(words[(i + j) % len(words)] for j in range(1 + i * 7 % 60)) + "." for i in range(200)]
+    stop = threading.Event()
+
+    def search(thread: int) -> int:
+        count = 0
+        while not stop.is_set():
+            assert service.search("a", f"{words[(thread + count) % len(words)]} {thread} {count}", top_k=2)
+            count += 1
+        return count
+
+    # Switch threads as often as possible, so tokenizer calls interleave.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(16) as pool:
+            searches = [pool.submit(search, thread) for thread in range(12)]
+            try:
+                # Other clients prepare their own indexes at the same time.
+                for prepared in [pool.submit(service.prepare, name, document) for name in "bcdefghi"]:
+                    prepared.result()
+            finally:
+                stop.set()
+            assert sum(future.result() for future in searches) > 0
+    finally:
+        sys.setswitchinterval(interval)
+    assert all(service.search(name, "village", top_k=1) for name in "bcdefghi")
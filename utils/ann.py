@@ -0,0 +1,193 @@
+import math
+
+import faiss
+import numpy as np
+
+
+class IndexSpec:
+    """
+    Describes which FAISS index to build over normalized embeddings.
+
+    All kinds use inner product, which on L2 normalized vectors is cosine
+    similarity, so search scores are "higher is better".
+
+    Kinds:
+        flat:  exact search, `IndexFlatIP`.
+        hnsw:  graph search, `IndexHNSWFlat`; tuned with `ef_search`.
+        ivf:   inverted lists, `IndexIVFFlat`; trained, tuned with `nprobe`.
+        ivfpq: inverted lists with product quantized codes, `IndexIVFPQ`;
+               codes use fewer than `pq_nbits` bits when trained on fewer
+               than 2 ** pq_nbits vectors.
+        auto:  flat below `auto_threshold` paragraphs and ivf above it, since
+               ivf supports the incremental add/remove of `IndexStore`.
+
+    `storage` sets how flat, hnsw and ivf indexes keep vectors: float32,
+    float16 (half the memory, scores within ~1e-3) or int8 (a quarter,
+    scalar quantized per dimension from the first vectors added). ivfpq
+    always stores PQ codes.
+    """
+    KINDS = ("auto", "flat", "hnsw", "ivf", "ivfpq")
+    STORAGES = {"float32": None, "float16": "QT_fp16", "int8": "QT_8bit"}
+
+    def __init__(self, kind: str = "auto", auto_threshold: int = 50_000, hnsw_m: int = 32,
+                 ef_construction: int = 200, ef_search: int = 64, nlist: int = None, nprobe: int = 16,
+                 pq_m: int = None, pq_nbits: int = 8, storage: str = "float32"):
+        if kind not in self.KINDS:
+            raise AssertionError(f"Wrong index kind {kind}, expected one of {self.KINDS}.")
+        if storage not in self.STORAGES:
+            raise AssertionError(f"Wrong vector storage {storage}, expected one of {tuple(self.STORAGES)}.")
+        self.kind = kind
+        self.storage = storage
+        self.auto_threshold = auto_threshold
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+
+    @classmethod
+    def parse(cls, spec) -> "IndexSpec":
+        """
+        Build a spec from an `IndexSpec`, None, or a string such as
+        "hnsw", "ivf:nlist=1024,nprobe=32" or "flat:storage=float16".
+        """
+        if spec is None:
+            return cls()
+        if isinstance(spec, IndexSpec):
+            return spec
+        kind, _, params = spec.partition(":")
+        kwargs = {}
+        for param in filter(None, params.split(",")):
+            name, value = param.split("=")
+            kwargs[name.strip()] = value.strip() if name.strip() == "storage" else int(value)
+        return cls(kind.strip(), **kwargs)
+
+    def resolve(self, n_vectors: int) -> str:
+        """
+        Concrete index kind for a corpus of `n_vectors`.
+        """
+        if self.kind != "auto":
+            return self.kind
+        return "flat" if n_vectors < self.auto_threshold else "ivf"
+
+    def __nlist(self, n_vectors: int) -> int:
+        if self.nlist:
+            if self.nlist > n_vectors:
+                print(f"Only {n_vectors} vectors to train {self.nlist} inverted lists, using {n_vectors}.")
+            return min(self.nlist, n_vectors)
+        # ~4 * sqrt(n) lists, keeping at least 39 training points per list.
+        return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+    def __pq_m(self, dim: int) -> int:
+        if self.pq_m:
+            return self.pq_m
+        # Largest number of sub-quantizers dividing dim with >= 8 dims each.
+        return max(m for m in range(1, dim // 8 + 1) if dim % m == 0)
+
+    def __pq_nbits(self, n_vectors: int) -> int:
+        # Each sub-quantizer trains 2 ** nbits centroids on the vectors.
+        nbits = max(1, min(self.pq_nbits, int(math.log2(max(n_vectors, 1)))))
+        if nbits < self.pq_nbits:
+            print(f"Only {n_vectors} vectors to train {self.pq_nbits} bit PQ codes, using {nbits} bits; "
+                  "rebuild the index once it holds more.")
+        return nbits
+
+    def build(self, vectors: np.ndarray, ids: np.ndarray, kind: str = None):
+        """
+        Create, train if needed, and fill an index with `vectors` under `ids`.
+        `kind` overrides the kind resolved from the spec.
+        """
+        n_vectors, dim = vectors.shape
+        kind = kind or self.resolve(n_vectors)
+        qtype = self.STORAGES[self.storage]
+        qtype = getattr(faiss.ScalarQuantizer, qtype) if qtype else None
+        if kind == "flat":
+            flat = (faiss.IndexFlatIP(dim) if qtype is None
+                    else faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT))
+            index = faiss.IndexIDMap2(flat)
+        elif kind == "hnsw":
+            hnsw = (faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT) if qtype is None
+                    else faiss.IndexHNSWSQ(dim, qtype, self.hnsw_m, faiss.METRIC_INNER_PRODUCT))
+            hnsw.hnsw.efConstruction = self.ef_construction
+            index = faiss.IndexIDMap2(hnsw)
+        elif kind == "ivf":
+            nlist = self.__nlist(n_vectors)
+            index = (faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT) if qtype is None
+                     else faiss.IndexIVFScalarQuantizer(faiss.IndexFlatIP(dim), dim, nlist, qtype,
+                                                        faiss.METRIC_INNER_PRODUCT))
+        else:
+            nbits = self.__pq_nbits(n_vectors)
+            index = faiss.IndexIVFPQ(faiss.IndexFlatIP(dim), dim, self.__nlist(n_vectors),
+                                     self.__pq_m(dim), nbits, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            # A single vector cannot train two centroids; repeat it.
+            index.train(vectors if n_vectors > 1 else np.repeat(vectors, 2, axis=0))
+        index.add_with_ids(vectors, ids)
+        self.tune(index)
+        return index
+
+    def tune(self, index) -> None:
+        """
+        Apply the query time knobs (`nprobe`, `ef_search`) to an index.
+        """
+        base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = self.ef_search
+        elif isinstance(base, faiss.IndexIVF):
+            base.nprobe = self.nprobe
+
+    def search_params(self, index, selector):
+        """
+        Search parameters restricting `index` to the ids of `selector`, with
+        the spec's query time knobs, which parameters would otherwise reset.
+        """
+        base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+        if isinstance(base, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        if isinstance(base, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    def remove(self, index, ids: np.ndarray, live_ids: np.ndarray):
+        """
+        Remove `ids` from `index` and return the resulting index. Indexes
+        without removal support (HNSW) are rebuilt from the vectors of
+        `live_ids`.
+        """
+        try:
+            index.remove_ids(ids)
+            return index
+        except RuntimeError:
+            if not len(live_ids):
+                return None
+            vectors = np.vstack([index.reconstruct(int(idx)) for idx in live_ids]).astype("float32")
+            return self.build(vectors, live_ids, kind=index_kind(index))
+
+
+def index_kind(index) -> str:
+    """
+    The `IndexSpec` kind of a built index.
+    """
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def index_storage(index) -> str:
+    """
+    The `IndexSpec` storage of a built index's vectors.
+    """
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if not isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float32"
+    qtype = base.sq.qtype
+    return "float16" if qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
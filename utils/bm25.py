@@ -0,0 +1,178 @@
+import os
+import re
+import math
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower cased word tokens; names, numbers and dates stay whole.
+    """
+    return TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over paragraph ids.
+
+    Postings are held in CSR form: term `t` owns `postings[indptr[t]:indptr[t + 1]]`
+    (paragraph ids, sorted) and the matching `tfs`, next to a per-id array of
+    paragraph lengths where 0 marks a removed or unknown id. Additions are
+    buffered and removals only zero the length; both are merged into the
+    arrays before the next query or `save`, with numpy sorts rather than
+    per-term Python lists. The index is saved as a single `.npz` file.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.__path = path
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    @property
+    def file(self) -> str:
+        return f"{self.__path}.npz"
+
+    def clear(self) -> None:
+        self.__terms = {}
+        self.__indptr = np.zeros(1, dtype="int64")
+        self.__postings = np.zeros(0, dtype="int64")
+        self.__tfs = np.zeros(0, dtype="float32")
+        self.__lengths = np.zeros(0, dtype="float32")
+        self.__staged = ([], [], [])
+        self.__dirty = False
+        self.__update_stats()
+
+    def __update_stats(self) -> None:
+        live = self.__lengths[self.__lengths > 0]
+        self.__n_docs = len(live)
+        self.__avg_length = float(live.mean()) if len(live) else 1.0
+
+    def __len__(self) -> int:
+        self.__merge()
+        return self.__n_docs
+
+    def add(self, ids: Iterable[int], texts: Iterable[str]) -> None:
+        """
+        Index `texts` under paragraph `ids`.
+        """
+        term_ids, doc_ids, tfs = self.__staged
+        new_lengths = {}
+        for idx, text in zip(ids, texts):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                term_ids.append(self.__terms.setdefault(term, len(self.__terms)))
+                doc_ids.append(int(idx))
+                tfs.append(tf)
+            new_lengths[int(idx)] = sum(counts.values())
+        if not new_lengths:
+            return
+        size = max(new_lengths) + 1
+        if size > len(self.__lengths):
+            self.__lengths = np.concatenate([self.__lengths, np.zeros(size - len(self.__lengths), dtype="float32")])
+        self.__lengths[list(new_lengths)] = list(new_lengths.values())
+        self.__dirty = True
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """
+        Drop paragraph `ids`; their postings are purged on the next merge.
+        """
+        ids = [int(idx) for idx in ids if int(idx) < len(self.__lengths)]
+        self.__lengths[ids] = 0
+        self.__dirty = True
+
+    def __merge(self) -> None:
+        """
+        Fold buffered additions into the CSR arrays and purge removed ids.
+        """
+        if not self.__dirty:
+            return
+        term_ids, doc_ids, tfs = self.__staged
+        old_terms = np.repeat(np.arange(len(self.__indptr) - 1, dtype="int64"), np.diff(self.__indptr))
+        terms = np.concatenate([old_terms, np.array(term_ids, dtype="int64")])
+        postings = np.concatenate([self.__postings, np.array(doc_ids, dtype="int64")])
+        frequencies = np.concatenate([self.__tfs, np.array(tfs, dtype="float32")])
+
+        keep = self.__lengths[postings] > 0
+        terms, postings, frequencies = terms[keep], postings[keep], frequencies[keep]
+        order = np.lexsort((postings, terms))
+        self.__postings, self.__tfs = postings[order], frequencies[order]
+        counts = np.bincount(terms, minlength=len(self.__terms))
+        self.__indptr = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        self.__staged = ([], [], [])
+        self.__dirty = False
+        self.__update_stats()
+
+    def search(self, query: str, top_k: int, ranges: Optional[List[Tuple[int, int]]] = None) -> list:
+        """
+        Return (paragraph id, BM25 score) pairs of the best matches, optionally
+        restricted to ids inside half open `ranges`.
+        """
+        self.__merge()
+        term_ids = [self.__terms[term] for term in set(tokenize(query)) if term in self.__terms]
+        if not term_ids or not self.__n_docs:
+            return []
+
+        scores = np.zeros(len(self.__lengths), dtype="float32")
+        for term_id in term_ids:
+            start, end = self.__indptr[term_id], self.__indptr[term_id + 1]
+            docs, tf = self.__postings[start:end], self.__tfs[start:end]
+            if not len(docs):
+                continue
+            idf = math.log(1 + (self.__n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.__lengths[docs] / self.__avg_length)
+            # Ids are unique within a posting list, so fancy indexing adds once.
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if ranges is not None:
+            allowed = np.zeros(len(scores), dtype=bool)
+            for start, end in ranges:
+                allowed[start:end] = True
+            scores[~allowed] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(idx), float(scores[idx])) for idx in candidates]
+
+    def save(self) -> None:
+        """
+        Write the index atomically to `<path>.npz`.
+        """
+        self.__merge()
+        vocabulary = np.frombuffer("\n".join(self.__terms).encode("utf-8"), dtype="uint8")
+        np.savez(f"{self.__path}.tmp.npz", vocabulary=vocabulary, indptr=self.__indptr,
+                 postings=self.__postings, tfs=self.__tfs, lengths=self.__lengths)
+        os.replace(f"{self.__path}.tmp.npz", self.file)
+
+    def load(self) -> bool:
+        """
+        Load a saved index; returns False if there is none.
+        """
+        self.clear()
+        if not os.path.exists(self.file):
+            return False
+        with np.load(self.file) as data:
+            vocabulary = data["vocabulary"].tobytes().decode("utf-8")
+            self.__terms = {term: i for i, term in enumerate(vocabulary.split("\n"))} if vocabulary else {}
+            self.__indptr, self.__postings = data["indptr"], data["postings"]
+            self.__tfs, self.__lengths = data["tfs"], data["lengths"].copy()
+        self.__update_stats()
+        return True
+
+
+def reciprocal_rank_fusion(rankings: List[list], top_k: int, k: int = 60) -> list:
+    """
+    Fuse ranked lists of (id, score) pairs: each id scores sum(1 / (k + rank))
+    over the lists it appears in, rank starting at 1.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (idx, _) in enumerate(ranking, start=1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
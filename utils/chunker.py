@@ -0,0 +1,228 @@
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Paragraphs shorter than this without closing punctuation are headings.
+HEADING_MAX_WORDS = 12
+HEADING_END = (".", "!", "?", ",", ";", ":")
+# Closing quotes and brackets after the punctuation, as in dialogue: "Let us go home!"
+CLOSING = "\"'”’)]»"
+# Bumped whenever heading detection changes, so indexes are re-chunked.
+HEADING_RULES = 2
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+# Upper edges of the chunk token histogram.
+HISTOGRAM_BINS = (32, 64, 128, 256, 512)
+
+
+def split_paragraphs(document: Union[str, Iterable[str]]) -> Iterator[str]:
+    """
+    Stripped, non-empty paragraphs of a document given as text with one
+    paragraph per line, or as a stream of its lines.
+    """
+    lines = document.split("\n") if isinstance(document, str) else document
+    return (line.strip() for line in lines if line.strip())
+
+
+def is_heading(paragraph: str) -> bool:
+    """
+    Whether a paragraph looks like a heading: a markdown "#" line, or a few
+    words without closing punctuation that are not just a page number.
+    """
+    if paragraph.startswith("#"):
+        return True
+    words = paragraph.split()
+    return (len(words) <= HEADING_MAX_WORDS and not paragraph.rstrip(CLOSING).endswith(HEADING_END)
+            and not paragraph.replace(" ", "").isdigit())
+
+
+class Chunker:
+    """
+    Packs a stream of paragraphs into chunks of about `target_tokens`.
+
+    Paragraphs are the units; a paragraph longer than the target is split at
+    sentence boundaries, and a sentence longer than the target at token
+    offsets, so no text is lost to the encoder's truncation. Headings start a
+    new chunk and are kept as its first line and as the `heading` metadata of
+    every chunk until the next heading. With `overlap_tokens` a chunk repeats
+    the last units of the previous chunk in the same section, up to that
+    many tokens.
+
+    Token lengths come from the encoder's tokenizer, called on `batch_size`
+    paragraphs (or their sentences) at a time. Chunks are (text, metadata)
+    pairs with the `page` the chunk starts on, its `end_page`, `heading` and
+    `tokens`.
+    """
+
+    def __init__(self, target_tokens: int = 200, overlap_tokens: int = 0, max_tokens: int = 510,
+                 batch_size: int = 256):
+        """
+        Args:
+            target_tokens (int): Tokens a chunk is filled up to.
+            overlap_tokens (int): Tokens of the previous chunk repeated at the
+                start of the next one; 0 disables overlap.
+            max_tokens (int): Tokens the encoder reads without truncating,
+                excluding special tokens; only used for statistics.
+            batch_size (int): Paragraphs tokenized per tokenizer call.
+        """
+        if not 0 <= overlap_tokens < target_tokens:
+            raise AssertionError("overlap_tokens must be smaller than target_tokens.")
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size
+        self.reset_stats()
+
+    @property
+    def signature(self) -> str:
+        """
+        Settings that change chunk boundaries; indexes record it so that a
+        different chunking triggers a rebuild.
+        """
+        return f"chunks:target={self.target_tokens},overlap={self.overlap_tokens},headings={HEADING_RULES}"
+
+    def reset_stats(self) -> None:
+        self.__lengths = []
+        self.__paragraphs = 0
+        self.__truncated_paragraphs = 0
+
+    def stats(self) -> dict:
+        """
+        Chunk count, token histogram and truncation counts since the last
+        `reset_stats`. `truncated` counts chunks the encoder would cut off;
+        `truncated_paragraphs` the paragraphs it would have cut off when
+        every paragraph was embedded whole.
+        """
+        lengths = np.array(self.__lengths, dtype="int64")
+        counts, _ = np.histogram(lengths, bins=(0,) + HISTOGRAM_BINS + (np.iinfo("int64").max,))
+        labels = [f"<={edge}" for edge in HISTOGRAM_BINS] + [f">{HISTOGRAM_BINS[-1]}"]
+        return {
+            "paragraphs": self.__paragraphs,
+            "chunks": len(lengths),
+            "mean_tokens": float(lengths.mean()) if len(lengths) else 0.0,
+            "max_tokens": int(lengths.max()) if len(lengths) else 0,
+            "histogram": dict(zip(labels, counts.tolist())),
+            "truncated": int((lengths > self.max_tokens).sum()),
+            "truncated_paragraphs": self.__truncated_paragraphs,
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        histogram = ", ".join(f"{label}: {count}" for label, count in stats["histogram"].items())
+        return (f"Chunks: {stats['chunks']} from {stats['paragraphs']} paragraphs, "
+                f"{stats['mean_tokens']:.0f} tokens on average (max {stats['max_tokens']}), "
+                f"{stats['truncated']} truncated ({stats['truncated_paragraphs']} paragraphs would have been). "
+                f"Tokens: {histogram}.")
+
+    def __token_windows(self, sentence: str, tokenizer) -> List[Tuple[str, int]]:
+        """
+        Cut a sentence longer than the target at token offsets.
+        """
+        encoding = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        pieces = []
+        for start in range(0, len(offsets), self.target_tokens):
+            window = offsets[start:start + self.target_tokens]
+            pieces.append((sentence[window[0][0]:window[-1][1]].strip(), len(window)))
+        return pieces
+
+    def __units(self, batch: list, tokenizer) -> Iterator[tuple]:
+        """
+        (text, tokens, page, starts_paragraph, heading) units of a batch of
+        (page, paragraph) pairs, each at most `target_tokens` long.
+        """
+        lengths = [len(ids) for ids in tokenizer([p for _, p in batch], add_special_tokens=False)["input_ids"]]
+        self.__paragraphs += len(batch)
+        self.__truncated_paragraphs += sum(length > self.max_tokens for length in lengths)
+
+        long_sentences = {i: SENTENCE_SPLIT.split(p) for i, ((_, p), length) in enumerate(zip(batch, lengths))
+                          if length > self.target_tokens}
+        flat = [sentence for sentences in long_sentences.values() for sentence in sentences]
+        sentence_lengths = iter([len(ids) for ids in tokenizer(flat, add_special_tokens=False)["input_ids"]]
+                                if flat else [])
+
+        for i, ((page, paragraph), length) in enumerate(zip(batch, lengths)):
+            if i not in long_sentences:
+                yield paragraph, length, page, True, is_heading(paragraph)
+                continue
+            first = True
+            for sentence in long_sentences[i]:
+                sentence_length = next(sentence_lengths)
+                pieces = ([(sentence, sentence_length)] if sentence_length <= self.target_tokens
+                          else self.__token_windows(sentence, tokenizer))
+                for text, tokens in pieces:
+                    yield text, tokens, page, first, False
+                    first = False
+
+    def chunk(self, paragraphs: Iterable[Union[str, Tuple[Optional[int], str]]], tokenizer) -> Iterator[tuple]:
+        """
+        Stream (text, metadata) chunks of `paragraphs`, given as strings or
+        (page, paragraph) pairs, using `tokenizer` for token lengths.
+        """
+        heading, current, fresh = None, [], False
+
+        def emit():
+            text = "".join(("\n" if starts and i else " " if i else "") + unit_text
+                           for i, (unit_text, _, _, starts, _) in enumerate(current))
+            tokens = sum(unit[1] for unit in current)
+            self.__lengths.append(tokens)
+            pages = [unit[2] for unit in current if unit[2] is not None]
+            return text, {"page": pages[0] if pages else None, "end_page": pages[-1] if pages else None,
+                          "heading": heading, "tokens": tokens}
+
+        def overlap():
+            carried, tokens = [], 0
+            units = list(current)
+            if self.overlap_tokens and not units[-1][4] and units[-1][1] > self.overlap_tokens:
+                # Carry the last sentences of a long last unit instead.
+                text, _, page, _, _ = units[-1]
+                sentences = SENTENCE_SPLIT.split(text)
+                lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+                units = [(sentence, length, page, False, False) for sentence, length in zip(sentences, lengths)]
+            for unit in reversed(units):
+                if unit[4] or tokens + unit[1] > self.overlap_tokens:
+                    break
+                carried.insert(0, unit)
+                tokens += unit[1]
+            return carried
+
+        for batch in _batches(paragraphs, self.batch_size):
+            for unit in self.__units(batch, tokenizer):
+                if unit[4]:
+                    if fresh:
+                        yield emit()
+                        current = []
+                    if not current or not current[-1][4]:
+                        current, heading = [], unit[0]
+                    else:
+                        heading = f"{heading} / {unit[0]}"
+                    current.append(unit)
+                    fresh = False
+                    continue
+                if fresh and sum(u[1] for u in current) + unit[1] > self.target_tokens:
+                    yield emit()
+                    current = overlap()
+                current.append(unit)
+                fresh = True
+        if fresh or current and current[-1][4]:
+            yield emit()
+
+    def split(self, document: str, tokenizer) -> list:
+        """
+        Chunks of a document given as text with one paragraph per line.
+        """
+        return list(self.chunk(split_paragraphs(document), tokenizer))
+
+
+def _batches(paragraphs: Iterable, size: int) -> Iterator[list]:
+    """
+    Group paragraphs into lists of (page, paragraph) pairs.
+    """
+    batch = []
+    for item in paragraphs:
+        batch.append((None, item) if isinstance(item, str) else tuple(item))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
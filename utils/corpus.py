@@ -0,0 +1,188 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+# Project level imports.
+from utils.encoder import get_encoder
+from utils.index_store import IndexStore
+from utils.ann import IndexSpec
+from utils.chunker import Chunker, split_paragraphs
+from utils.lru_cache import LRUCache
+from utils import tracing
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def _read_document(doc_name: str, doc_type: str) -> str:
+    """
+    Extract one file's text; runs in a worker process, so pages are not
+    extracted by a pool of their own.
+    """
+    from utils.document import Document
+    return Document(doc_name=doc_name, type=doc_type, workers=1).document
+
+
+def _read_documents(files: List[Tuple[str, str]], workers: int = None) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (doc_name, text) of files extracted in worker processes, in order.
+    Only a few files per worker are in flight, so finished texts wait for
+    the consumer instead of piling up in memory.
+    """
+    window = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for doc_name, doc_type in files:
+            pending.append((doc_name, pool.submit(_read_document, doc_name, doc_type)))
+            if len(pending) >= window:
+                name, future = pending.popleft()
+                yield name, future.result()
+        while pending:
+            name, future = pending.popleft()
+            yield name, future.result()
+
+
+class CorpusSearcher:
+    """
+    Searcher over a library of documents sharing one index and one encoder.
+
+    Paragraphs keep a link to their document, so searches can be restricted
+    to one or a few documents; see `IndexStore` for how the restriction is
+    applied inside FAISS.
+    """
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", index_path="corpus", batch_size=32,
+                 index_spec: IndexSpec = None, workers: int = None, cache_size: int = 1024,
+                 chunker: Chunker = None, hybrid: bool = True):
+        """
+        Args:
+            model_name (str): Hugging Face encoder used for paragraphs and queries.
+            index_path (str): Index name inside INDEX_DIR.
+            batch_size (int): Paragraphs embedded per forward pass.
+            index_spec (IndexSpec | str): FAISS index to build, see `IndexSpec`.
+            workers (int): Processes used to extract files, defaults to the CPU count.
+            cache_size (int): Search results remembered per index version.
+            chunker (Chunker): How paragraphs are packed into indexed chunks;
+                defaults to `Chunker()`.
+            hybrid (bool): Fuse BM25 keyword matches with the dense results,
+                which finds exact names and dates the encoder misses.
+        """
+        self.__encoder = get_encoder(model_name)
+        self.__chunker = chunker if chunker is not None else Chunker(max_tokens=self.__encoder.max_length - 2)
+        self.__store = IndexStore(os.path.join(os.environ["INDEX_DIR"], index_path), model_name, index_spec,
+                                  self.__chunker.signature, getattr(self.__encoder, "backend", "torch"))
+        self.__batch_size = batch_size
+        # Paragraphs of a streamed document embedded and appended at a time.
+        self.__stream_batch_size = 8 * batch_size
+        self.__workers = workers
+        self.__results = LRUCache(cache_size)
+        self.__hybrid = hybrid
+        self.__store.load()
+
+    @property
+    def documents(self) -> list:
+        return self.__store.documents
+
+    def __embed_texts(self, texts: list) -> np.ndarray:
+        """
+        Generate embeddings for many texts with the shared encoder.
+        """
+        return self.__encoder.embed(texts, self.__batch_size)
+
+    def __split(self, document: str) -> list:
+        """
+        Chunks of a document text with one paragraph per line.
+        """
+        return self.__chunker.split(document, self.__encoder.tokenizer)
+
+    def __chunk(self, paragraphs: Iterable[str]) -> Iterable:
+        """
+        Chunks of a stream of document lines, produced lazily.
+        """
+        return self.__chunker.chunk(split_paragraphs(paragraphs), self.__encoder.tokenizer)
+
+    @tracing.traced("prepare_index")
+    def add_documents(self, documents: Union[Dict[str, str], Iterable[Tuple[str, str]]],
+                      save_every: int = 32) -> None:
+        """
+        Add or update documents given as name -> text, or as a stream of
+        (name, text) pairs read one document at a time. Unchanged documents
+        are skipped; changed ones are chunked, embedded and appended in
+        batches, and the index is saved every `save_every` changed documents
+        so an interrupted ingest keeps its progress.
+
+        While there is no index yet, changed documents are pooled until they
+        hold `auto_threshold` paragraphs and indexed in one pass, so the index
+        kind and IVF training see more than the first document.
+        """
+        items = documents.items() if isinstance(documents, dict) else documents
+        self.__chunker.reset_stats()
+        pooled, pooled_lines, total, changed, unsaved = {}, 0, 0, 0, 0
+        for name, text in items:
+            total += 1
+            if self.__store.is_current(name, text):
+                continue
+            changed += 1
+            if self.__store.index is None:
+                pooled[name] = text
+                pooled_lines += text.count("\n") + 1
+                if pooled_lines < self.__store.spec.auto_threshold:
+                    continue
+                self.__store.sync(pooled, self.__split, self.__embed_texts)
+                unsaved += len(pooled)
+                pooled, pooled_lines = {}, 0
+            else:
+                self.__store.sync_stream(name, text.split("\n"), self.__chunk, self.__embed_texts,
+                                         self.__stream_batch_size)
+                unsaved += 1
+            if unsaved >= save_every:
+                self.__store.save()
+                print(f"Corpus index saved after {changed} changed documents.")
+                unsaved = 0
+        if pooled:
+            self.__store.sync(pooled, self.__split, self.__embed_texts)
+            unsaved += len(pooled)
+        if not changed:
+            print("Corpus index is up to date.")
+            return
+        print(f"Updated {changed} of {total} documents.")
+        print(self.__chunker.report())
+        if unsaved:
+            self.__store.save()
+        print("Corpus index saved.")
+
+    def remove_documents(self, names: Iterable[str]) -> None:
+        """
+        Remove documents and their paragraphs from the index.
+        """
+        self.__store.sync({name: None for name in names}, self.__split, self.__embed_texts)
+        self.__store.save()
+
+    @tracing.traced("ingest")
+    def ingest(self, files: List[Tuple[str, str]]) -> None:
+        """
+        Extract (doc_name, doc_type) files from DOC_PATH in parallel worker
+        processes and add them to the index, keyed by doc_name, as they are
+        extracted; see `add_documents`.
+        """
+        self.add_documents(_read_documents(files, self.__workers))
+
+    @tracing.traced("search")
+    def search(self, query: str, top_k: int = 3, documents: Iterable[str] = None) -> list:
+        """
+        Return (paragraph, score, document name) triples for the best matches,
+        optionally restricted to the named documents. Results are cached per
+        index version under the normalized query, see `IndexStore.query`.
+        """
+        results = self.__store.query(query, self.__encoder.embed_query, top_k, documents, self.__hybrid,
+                                     self.__results)
+        return [(self.__store.paragraphs[idx], score, self.__store.document_of(idx)) for idx, score in results]
+
+    def search_entity(self, query: str, top_k: int = 3, documents: Iterable[str] = None) -> list:
+        """
+        Same as `EntitySearcher.search_entity`: (paragraph, score) pairs.
+        """
+        return [(paragraph, score) for paragraph, score, _ in self.search(query, top_k, documents)]
@@ -1,57 +1,174 @@
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Tuple
+
 import PyPDF2
 from dotenv import load_dotenv
 load_dotenv()
 
+# Lines ending with these close a paragraph, see `clean_paragraphs`.
+SENTENCE_END = (".", "!", "?")
+
+_reader = None
+
+
+def _open_pdf(pdf_path: str) -> None:
+    """
+    Open the PDF once per worker process.
+    """
+    global _reader
+    _reader = PyPDF2.PdfReader(pdf_path)
+
+
+def _extract_pages(start: int, end: int) -> list:
+    """
+    Text of pages [start, end) of the worker's PDF.
+    """
+    return [_reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def _lines(chunks: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """
+    (chunk number, line) pairs of the text formed by concatenating `chunks`,
+    without joining them. A line is numbered after the chunk it starts in.
+    """
+    tail, tail_number = "", 1
+    for number, chunk in enumerate(chunks, start=1):
+        if not tail:
+            tail_number = number
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        for i, line in enumerate(lines):
+            yield (tail_number if i == 0 else number), line
+        if lines:
+            tail_number = number
+    yield tail_number, tail
+
+
+def clean_paragraphs(chunks: Iterable[str], pages: bool = False) -> Iterator:
+    """
+    Stream the non-empty paragraphs of the text formed by `chunks`, or with
+    `pages` (chunk number, paragraph) pairs, numbered after the chunk the
+    paragraph starts in.
+
+    Lines are merged into one paragraph unless a line ends a sentence or is
+    followed by a blank line; this is the line merging the regex
+    `(?<![.!?])\\n(?!\\n)` applied to the whole text, followed by a split on
+    newlines, done one line at a time.
+    """
+    paragraph, previous, page = [], None, None
+    for number, line in _lines(chunks):
+        if previous is not None and (previous.endswith(SENTENCE_END) or line == ""):
+            text = " ".join(paragraph).strip()
+            if text:
+                yield (page, text) if pages else text
+            paragraph, page = [], None
+        if page is None and line.strip():
+            page = number
+        paragraph.append(line)
+        previous = line
+    text = " ".join(paragraph).strip()
+    if text:
+        yield (page, text) if pages else text
+
+
 class Document:
     doc_path = os.environ['DOC_PATH']
+    # Bytes read from a text file at a time.
+    read_size = 1 << 20
 
-    def __init__(self, doc=None, doc_name=None, type=None):
+    def __init__(self, doc=None, doc_name=None, type=None, workers=None, pages_per_task=16):
+        """
+        Args:
+            doc (str): Document text, when it is not read from DOC_PATH.
+            doc_name (str): File name inside DOC_PATH.
+            type (str): "TXT" or "PDF".
+            workers (int): Processes extracting PDF pages, defaults to the CPU
+                count; 1 extracts in this process.
+            pages_per_task (int): PDF pages extracted per worker task.
+        """
         self.doc_name = doc_name
         self.__doc = doc
-        self.__type = type
+        self.__text = None
+        self.__type = type.lower() if type else None
+        self.__workers = workers or os.cpu_count() or 1
+        self.__pages_per_task = pages_per_task
 
-        self._process_doc()
+        if self.__type not in (None, 'txt', 'pdf'):
+            raise AssertionError("Wrong Document Type.")
 
-    def _get_text(self):
-        txt_path = os.path.join(self.doc_path, self.doc_name)
-        with open(txt_path, "r") as file:  
-            content = file.read()  
-        self.__doc = content
+    @property
+    def path(self) -> str:
+        return os.path.join(self.doc_path, self.doc_name)
 
-    def _extract_text_from_pdf(self):
-        pdf_path = os.path.join(self.doc_path, self.doc_name)
-        text = ""
-        with open(pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
+    def _read_text(self) -> Iterator[str]:
+        with open(self.path, "r") as file:
+            while True:
+                chunk = file.read(self.read_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _extract_pdf_pages(self) -> Iterator[str]:
+        """
+        Yield page texts in order. Pages are extracted by a process pool with
+        a bounded number of tasks in flight, so extraction never runs far
+        ahead of the consumer.
+        """
+        reader = PyPDF2.PdfReader(self.path)
+        n_pages = len(reader.pages)
+        if self.__workers == 1 or n_pages <= self.__pages_per_task:
             for page in reader.pages:
-                text += page.extract_text()
-        self.__doc = text
-    
-    def _preprocess_text(self):
-        import re
-        """
-        Preprocess text to merge lines that belong to the same paragraph.
-        """
-        # Replace single newlines with a space if the line does not end with punctuation
-        self.__doc = re.sub(r"(?<![.!?])\n(?!\n)", " ", self.__doc)
-
-    def _process_doc(self):
-        if not self.__type:
-            self._preprocess_text
-        elif self.__type.lower() == 'txt':
-            self._get_text()
-            self._preprocess_text()
-        elif self.__type.lower() == 'pdf':
-            self._extract_text_from_pdf()
-            self._preprocess_text()
-        else:
-            raise AssertionError("Wrong Document Type.")
-        
+                yield page.extract_text()
+            return
+
+        tasks = [(start, min(start + self.__pages_per_task, n_pages))
+                 for start in range(0, n_pages, self.__pages_per_task)]
+
+        with ProcessPoolExecutor(max_workers=self.__workers, initializer=_open_pdf, initargs=(self.path,)) as pool:
+            tasks, pending = deque(tasks), deque()
+            while tasks or pending:
+                while tasks and len(pending) < 2 * self.__workers:
+                    pending.append(pool.submit(_extract_pages, *tasks.popleft()))
+                yield from pending.popleft().result()
+
+    def pages(self) -> Iterator[str]:
+        """
+        Stream the raw text of the document: pages of a PDF, blocks of a
+        text file, or the given `doc`.
+        """
+        if self.__type == 'txt':
+            return self._read_text()
+        if self.__type == 'pdf':
+            return self._extract_pdf_pages()
+        return iter([self.__doc or ""])
+
+    def paragraphs(self, pages: bool = False) -> Iterator:
+        """
+        Stream cleaned paragraphs without holding the document as one string.
+        Pass this to `EntitySearcher.prepare_index` to index a large document.
+
+        With `pages` yield (page number, paragraph) pairs instead; the page is
+        where the paragraph starts in a PDF and None for other documents.
+        """
+        if not pages:
+            return clean_paragraphs(self.pages())
+        if self.__type == 'pdf':
+            return clean_paragraphs(self.pages(), pages=True)
+        return ((None, paragraph) for paragraph in clean_paragraphs(self.pages()))
+
     @property
     def document(self):
-        return self.__doc
+        """
+        The cleaned document, one paragraph per line. Built on first access.
+        """
+        if self.__type is None:
+            return self.__doc
+        if self.__text is None:
+            self.__text = "\n".join(self.paragraphs())
+        return self.__text
 
 if __name__ == "__main__":
     obj = Document(doc_name="lion_story.txt", type='TXT')
-    obj.document
\ No newline at end of file
+    obj.document
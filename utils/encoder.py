@@ -0,0 +1,268 @@
+import os
+import re
+import threading
+import contextlib
+
+import numpy as np
+
+# Project level imports.
+from utils.lru_cache import LRUCache
+from utils import tracing
+
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def onnx_path(model_name: str, quantized: bool = False) -> str:
+    """
+    Where the ONNX export of `model_name` is cached, under ENCODER_CACHE_DIR.
+    """
+    cache_dir = os.getenv("ENCODER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "agentqa", "onnx"))
+    name = re.sub(r"[^\w.-]+", "_", model_name.strip("/"))
+    return os.path.join(cache_dir, name, "model.int8.onnx" if quantized else "model.onnx")
+
+
+def export_onnx(model_name: str, quantized: bool = False) -> str:
+    """
+    Export `model_name` to ONNX (and quantize its weights to int8) unless a
+    cached export exists; returns its path. Files are written under a
+    temporary name first, so concurrent exports do not see partial files.
+    """
+    path = onnx_path(model_name, quantized)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if quantized:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(export_onnx(model_name), tmp_path, weight_type=QuantType.QInt8)
+    else:
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+        print(f"Exporting {model_name} to ONNX.")
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        inputs = dict(AutoTokenizer.from_pretrained(model_name)(["an example text"], return_tensors="pt"))
+        names = list(inputs)
+
+        class LastHiddenState(torch.nn.Module):
+            # Positional inputs in `names` order, the traced graph's signature.
+            def __init__(self):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *tensors):
+                return self.model(**dict(zip(names, tensors))).last_hidden_state
+
+        axes = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(LastHiddenState(), tuple(inputs.values()), tmp_path, input_names=names,
+                              output_names=["last_hidden_state"],
+                              dynamic_axes={**{name: axes for name in inputs}, "last_hidden_state": axes},
+                              opset_version=17, dynamo=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+class LockedTokenizer:
+    """
+    A tokenizer whose calls are serialized. A fast tokenizer keeps its
+    truncation and padding settings as state set by each call, so threads
+    calling it with different settings (batched embeds, chunk measuring)
+    would otherwise get each other's and fail or mis-pad. Everything else
+    is the wrapped tokenizer's.
+    """
+
+    def __init__(self, tokenizer):
+        self.__tokenizer = tokenizer
+        self.__lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.__lock:
+            return self.__tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.__tokenizer, name)
+
+
+class Encoder:
+    """
+    Sentence encoder whose tokenizer and weights are loaded on first use.
+
+    torch and transformers are imported lazily too, so processes that only
+    load existing indexes never pay for them until a query is embedded.
+    Use `get_encoder` to share one instance per model across searchers.
+
+    Backends:
+        torch:      eager PyTorch in float32.
+        torch-int8: PyTorch with the linear layers dynamically quantized to int8.
+        onnx:       ONNX Runtime on a cached export of the model.
+        onnx-int8:  ONNX Runtime on the export with int8 weights.
+    Embeddings of every backend are mean pooled and L2 normalized alike;
+    `benchmarks.bench_encoder` bounds how far they drift from torch.
+    """
+    # Tokens per text, including special tokens; longer texts are truncated.
+    max_length = 512
+
+    def __init__(self, model_name: str, query_cache_size: int = 1024, backend: str = "torch"):
+        if backend not in BACKENDS:
+            raise AssertionError(f"Wrong encoder backend {backend}, expected one of {BACKENDS}.")
+        self.__model_name = model_name
+        self.__backend = backend
+        self.__tokenizer = None
+        self.__model = None
+        self.__hidden_size = None
+        self.__lock = threading.Lock()
+        self.__query_cache = LRUCache(query_cache_size)
+
+    @property
+    def model_name(self) -> str:
+        return self.__model_name
+
+    @property
+    def backend(self) -> str:
+        return self.__backend
+
+    @property
+    def loaded(self) -> bool:
+        return self.__model is not None
+
+    @property
+    def tokenizer(self) -> LockedTokenizer:
+        """
+        The model's tokenizer, loaded without the model weights. It is
+        shared by every thread, so calls go through a lock.
+        """
+        if self.__tokenizer is None:
+            with self.__lock:
+                if self.__tokenizer is None:
+                    from transformers import AutoTokenizer
+                    self.__tokenizer = LockedTokenizer(AutoTokenizer.from_pretrained(self.__model_name))
+        return self.__tokenizer
+
+    def load(self) -> None:
+        """
+        Load the tokenizer and model once, safe to call from many threads.
+        """
+        if self.__model is not None:
+            return
+        self.tokenizer
+        with self.__lock:
+            if self.__model is not None:
+                return
+            from transformers import AutoConfig
+            self.__hidden_size = AutoConfig.from_pretrained(self.__model_name).hidden_size
+            if self.__backend.startswith("onnx"):
+                self.__model = self.__load_onnx()
+                return
+            import torch
+            from transformers import AutoModel
+            model = AutoModel.from_pretrained(self.__model_name)
+            model.eval()
+            if self.__backend == "torch-int8":
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.__model = model
+
+    def __load_onnx(self):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(f"The {self.__backend} encoder backend needs the onnxruntime package "
+                              "(and onnx to export the model).") from e
+        path = export_onnx(self.__model_name, quantized=self.__backend == "onnx-int8")
+        return onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def __embed_batch(self, texts: list) -> np.ndarray:
+        """
+        Generate L2 normalized embeddings for one batch, padded to the longest
+        text in it.
+        """
+        if self.__backend.startswith("onnx"):
+            return self.__embed_batch_onnx(texts)
+        import torch
+        inputs = self.__tokenizer(texts, return_tensors="pt", truncation=True, max_length=self.max_length,
+                                  padding="longest")
+        outputs = self.__model(**inputs)
+        # Mean pool over real tokens only, padding must not dilute the vector.
+        mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        summed = (outputs.last_hidden_state * mask).sum(dim=1)
+        counts = mask.sum(dim=1).clamp(min=1e-9)
+        embeddings = summed / counts
+        return torch.nn.functional.normalize(embeddings, p=2, dim=1).cpu().numpy()
+
+    def __embed_batch_onnx(self, texts: list) -> np.ndarray:
+        """
+        `__embed_batch` on ONNX Runtime, pooled in numpy.
+        """
+        inputs = self.__tokenizer(texts, return_tensors="np", truncation=True, max_length=self.max_length,
+                                  padding="longest")
+        feed = {node.name: inputs[node.name].astype("int64") for node in self.__model.get_inputs()}
+        hidden = self.__model.run(["last_hidden_state"], feed)[0]
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return (embeddings / norms).astype("float32")
+
+    @tracing.traced("embed")
+    def embed(self, texts: list, batch_size: int = 32) -> np.ndarray:
+        """
+        Generate embeddings for many texts in length-sorted batches.
+
+        Texts of similar length are bucketed together so that dynamic padding
+        stays small; the result rows follow the order of `texts`.
+        """
+        self.load()
+        hidden_size = self.__hidden_size
+        if not texts:
+            return np.zeros((0, hidden_size), dtype="float32")
+
+        tracing.annotate(texts=len(texts), batch_size=batch_size)
+        lengths = [len(ids) for ids in self.__tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]]
+        order = np.argsort(lengths, kind="stable")
+        embeddings = np.empty((len(texts), hidden_size), dtype="float32")
+        with self.__inference_mode():
+            for start in range(0, len(texts), batch_size):
+                batch_idx = order[start:start + batch_size]
+                with tracing.span("embed_batch", size=len(batch_idx)):
+                    embeddings[batch_idx] = self.__embed_batch([texts[i] for i in batch_idx])
+        return embeddings
+
+    def __inference_mode(self):
+        if self.__backend.startswith("onnx"):
+            return contextlib.nullcontext()
+        import torch
+        return torch.inference_mode()
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embedding of one query as a (1, dim) array, memoized since agents
+        repeat the same keywords within and across questions.
+        """
+        embedding = self.__query_cache.get(query)
+        if embedding is None:
+            embedding = self.embed([query])
+            embedding.setflags(write=False)
+            self.__query_cache.put(query, embedding)
+        return embedding
+
+    def clear_cache(self) -> None:
+        """
+        Forget memoized query embeddings.
+        """
+        self.__query_cache.clear()
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model_name: str, backend: str = None) -> Encoder:
+    """
+    Process-wide `Encoder` for `model_name`; every caller shares its weights.
+    `backend` defaults to ENCODER_BACKEND, or "torch".
+    """
+    backend = backend or os.getenv("ENCODER_BACKEND", "torch")
+    with _encoders_lock:
+        if (model_name, backend) not in _encoders:
+            _encoders[model_name, backend] = Encoder(model_name, backend=backend)
+        return _encoders[model_name, backend]
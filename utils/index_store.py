@@ -0,0 +1,489 @@
+import os
+import json
+import bisect
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+# Project level imports.
+from utils.paragraph_store import ParagraphStore
+from utils.ann import IndexSpec, index_kind, index_storage
+from utils.bm25 import BM25Index, reciprocal_rank_fusion
+from utils.lru_cache import LRUCache, normalize_query
+from utils import tracing
+
+
+def text_hash(text: str) -> str:
+    """
+    Hex digest used to detect document changes.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def paragraph_key(model_name: str, paragraph: str) -> str:
+    """
+    Content address of a paragraph embedding: the same text embedded by the
+    same model always maps to the same key.
+    """
+    return text_hash(f"{model_name}\0{paragraph}")
+
+
+def id_ranges(ids: Iterable[int]) -> List[Tuple[int, int]]:
+    """
+    Collapse ids into sorted, half open (start, end) ranges.
+    """
+    ranges = []
+    for idx in sorted(ids):
+        if ranges and ranges[-1][1] == idx:
+            ranges[-1][1] = idx + 1
+        else:
+            ranges.append([idx, idx + 1])
+    return [(start, end) for start, end in ranges]
+
+
+class IndexStore:
+    """
+    FAISS index and paragraphs of one or more documents, persisted next to a
+    JSON manifest.
+
+    Every paragraph gets an integer id which is both its position in the
+    `ParagraphStore` and its FAISS id, so rows can be removed or appended
+    without re-embedding the rest of a document. The manifest records the
+    model and its encoder backend (see `utils.encoder.BACKENDS`), whose
+    vectors differ slightly and must not be mixed, the embedding dimension,
+    index kind and vector storage, and for every
+    document its hash and a map from paragraph keys (see `paragraph_key`) to
+    ids.
+
+    A document's paragraphs are appended together, so each document owns a
+    few contiguous id ranges; searches restricted to some documents use those
+    ranges as a FAISS id selector instead of filtering afterwards.
+
+    "Paragraphs" are whatever the caller's split produced, usually chunks of
+    `utils.chunker.Chunker`. Splits may yield (text, metadata) pairs; the
+    metadata (page, heading, ...) is kept as JSON in a second store under the
+    same ids. The manifest records the `chunking` so that a different split
+    rebuilds the index.
+
+    A BM25 index over the same ids (`<path>.bm25.npz`) is kept in step with
+    FAISS for lexical and hybrid search; indexes saved without one get it
+    built from their paragraphs on load.
+    """
+    MANIFEST_VERSION = 3
+
+    def __init__(self, index_path: str, model_name: str, index_spec: IndexSpec = None, chunking: str = "lines",
+                 backend: str = "torch"):
+        self.__index_path = index_path
+        self.__model_name = model_name
+        self.__backend = backend
+        self.__chunking = chunking
+        self.__spec = IndexSpec.parse(index_spec)
+        self.__index = None
+        self.__mapped = False
+        self.__paragraphs = ParagraphStore(f"{index_path}_paragraphs")
+        self.__metadata = ParagraphStore(f"{index_path}_metadata")
+        self.__lexical = BM25Index(f"{index_path}.bm25")
+        self.__documents = {}
+        self.__ranges = {}
+        self.__range_starts, self.__range_owners = [], []
+        self.__version = None
+
+    @property
+    def index(self):
+        return self.__index
+
+    @property
+    def spec(self) -> IndexSpec:
+        return self.__spec
+
+    @property
+    def paragraphs(self) -> ParagraphStore:
+        return self.__paragraphs
+
+    @property
+    def documents(self) -> list:
+        return list(self.__documents)
+
+    @property
+    def version(self) -> str:
+        """
+        Changes whenever the indexed content changes; scopes result caches.
+        """
+        return self.__version
+
+    @property
+    def index_file(self) -> str:
+        return f"{self.__index_path}.faiss"
+
+    @property
+    def manifest_file(self) -> str:
+        return f"{self.__index_path}.manifest.json"
+
+    def __read_manifest(self) -> dict:
+        """
+        Read the manifest, or return None if it is missing or incompatible.
+        """
+        if not os.path.exists(self.manifest_file):
+            if os.path.exists(self.index_file):
+                print("Index has no manifest, it will be rebuilt.")
+            return None
+        with open(self.manifest_file, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == 2:
+            # Single document manifests, named after the index.
+            name = os.path.basename(self.__index_path)
+            manifest["documents"] = {name: {"hash": manifest.pop("document_hash"), "keys": manifest.pop("keys")}}
+            manifest["version"] = self.MANIFEST_VERSION
+        if manifest.get("version") != self.MANIFEST_VERSION:
+            print("Index manifest version mismatch, it will be rebuilt.")
+            return None
+        if manifest.get("model") != self.__model_name:
+            print(f"Index was built with {manifest.get('model')}, not {self.__model_name}. It will be rebuilt.")
+            return None
+        # Indexes from before encoder backends were all embedded with torch.
+        if manifest.get("backend", "torch") != self.__backend:
+            print(f"Index was embedded by the {manifest.get('backend', 'torch')} encoder backend, not "
+                  f"{self.__backend}. It will be rebuilt.")
+            return None
+        if manifest.get("chunking", "lines") != self.__chunking:
+            print(f"Index was split as {manifest.get('chunking', 'lines')}, not {self.__chunking}. It will be rebuilt.")
+            return None
+        if self.__spec.kind not in ("auto", manifest.get("index")):
+            print(f"Index is {manifest.get('index')}, not {self.__spec.kind}. It will be rebuilt.")
+            return None
+        if manifest.get("storage", "float32") != self.__spec.storage and manifest.get("index") != "ivfpq":
+            print(f"Index stores {manifest.get('storage', 'float32')} vectors, not {self.__spec.storage}. "
+                  "It will be rebuilt.")
+            return None
+        return manifest
+
+    def __reset(self) -> None:
+        self.__paragraphs.close()
+        self.__metadata.close()
+        self.__lexical.clear()
+        self.__index, self.__mapped, self.__documents = None, False, {}
+        self.__update_ranges()
+
+    def __update_ranges(self) -> None:
+        """
+        Recompute document id ranges, the sorted range table used to map a
+        paragraph id back to its document, and the content version.
+        """
+        self.__ranges = {name: id_ranges(doc["keys"].values()) for name, doc in self.__documents.items()}
+        table = sorted((start, name) for name, ranges in self.__ranges.items() for start, _ in ranges)
+        self.__range_starts = [start for start, _ in table]
+        self.__range_owners = [name for _, name in table]
+        self.__version = text_hash(json.dumps(sorted((name, doc["hash"]) for name, doc in self.__documents.items())))
+
+    @tracing.traced("index_load")
+    def load(self, mmap: bool = True) -> bool:
+        """
+        Load the index, paragraphs and documents if a compatible manifest exists.
+
+        With `mmap` the FAISS index is memory mapped read-only so processes
+        serving the same index share its pages; `sync` reloads it writable.
+        IO_FLAG_MMAP alone only maps IVF lists, flat and HNSW codes need
+        IO_FLAG_MMAP_IFC, which older FAISS builds lack.
+        """
+        self.__reset()
+        manifest = self.__read_manifest()
+        if manifest is None or not os.path.exists(self.index_file):
+            return False
+
+        if not self.__paragraphs.exists():
+            return False
+
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) if mmap else 0
+        index = faiss.read_index(self.index_file, flags)
+        if index.d != manifest["dim"]:
+            print("Index dimension does not match its manifest, it will be rebuilt.")
+            return False
+
+        self.__spec.tune(index)
+        self.__index, self.__mapped = index, mmap
+        self.__paragraphs = ParagraphStore(f"{self.__index_path}_paragraphs")
+        self.__metadata = ParagraphStore(f"{self.__index_path}_metadata")
+        self.__documents = manifest["documents"]
+        self.__update_ranges()
+        if not self.__lexical.load():
+            print("Building the lexical index from stored paragraphs.")
+            ids = [idx for doc in self.__documents.values() for idx in doc["keys"].values()]
+            self.__lexical.add(ids, (self.__paragraphs[idx] for idx in ids))
+            self.__lexical.save()
+        return True
+
+    @tracing.traced("index_save")
+    def save(self) -> None:
+        """
+        Persist the index, paragraphs and manifest. Each file is written to a
+        temporary path first so readers never see a half written file.
+        """
+        if self.__index is None:
+            return
+        faiss.write_index(self.__index, f"{self.index_file}.tmp")
+        os.replace(f"{self.index_file}.tmp", self.index_file)
+
+        self.__paragraphs.save()
+        self.__metadata.save()
+        self.__lexical.save()
+
+        manifest = {
+            "version": self.MANIFEST_VERSION,
+            "model": self.__model_name,
+            "backend": self.__backend,
+            "dim": self.__index.d,
+            "index": index_kind(self.__index),
+            "storage": index_storage(self.__index),
+            "chunking": self.__chunking,
+            "documents": self.__documents,
+        }
+        with open(f"{self.manifest_file}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{self.manifest_file}.tmp", self.manifest_file)
+
+    def is_current(self, name: str, document: str) -> bool:
+        """
+        Whether the loaded index holds exactly this version of document `name`.
+        """
+        return (self.__index is not None and name in self.__documents
+                and self.__documents[name]["hash"] == text_hash(document))
+
+    def metadata(self, idx: int) -> Optional[dict]:
+        """
+        Metadata stored with paragraph `idx`, if any.
+        """
+        if int(idx) >= len(self.__metadata):
+            return None
+        value = self.__metadata[idx]
+        return json.loads(value) if value else None
+
+    def __set_metadata(self, idx: int, metadata: Optional[dict]) -> None:
+        """
+        Stage `metadata` for paragraph `idx` if it changed, e.g. when an
+        unchanged chunk moved to another page.
+        """
+        if metadata is None or self.metadata(idx) == metadata:
+            return
+        while len(self.__metadata) < idx:
+            self.__metadata.append("")
+        if len(self.__metadata) == idx:
+            self.__metadata.append(json.dumps(metadata))
+        else:
+            self.__metadata.replace(idx, json.dumps(metadata))
+
+    @tracing.traced("index_sync")
+    def sync(self, documents: Dict[str, Optional[str]], split: Callable[[str], Iterable],
+             embed: Callable[[list], np.ndarray]) -> None:
+        """
+        Bring the given documents in line with their text: embed only
+        paragraphs whose key is unknown for that document and remove ids of
+        paragraphs no longer present. A None text removes the document.
+        Documents not mentioned are left untouched. `split` returns a
+        document's paragraphs as strings or (text, metadata) pairs.
+        """
+        stale_ids, new = [], []
+        for name, document in documents.items():
+            keys = self.__documents.get(name, {"keys": {}})["keys"]
+            wanted = {}
+            for item in (split(document) if document is not None else []):
+                paragraph, metadata = (item, None) if isinstance(item, str) else item
+                wanted.setdefault(paragraph_key(self.__model_name, paragraph), (paragraph, metadata))
+
+            stale_ids.extend(keys.pop(key) for key in [key for key in keys if key not in wanted])
+            new.extend((name, key, paragraph, metadata) for key, (paragraph, metadata) in wanted.items()
+                       if key not in keys)
+            for key, idx in keys.items():
+                self.__set_metadata(idx, wanted[key][1])
+            if document is None:
+                self.__documents.pop(name, None)
+            else:
+                self.__documents[name] = {"hash": text_hash(document), "keys": keys}
+
+        if stale_ids:
+            self.__remove(stale_ids)
+        if new:
+            self.__append(new, embed)
+
+        self.__update_ranges()
+        total = sum(len(doc["keys"]) for doc in self.__documents.values())
+        tracing.annotate(embedded=len(new), removed=len(stale_ids), total=total)
+        print(f"Index synced: {len(new)} embedded, {len(stale_ids)} removed, {total} total.")
+
+    @tracing.traced("index_sync")
+    def sync_stream(self, name: str, paragraphs: Iterable, split: Callable[[Iterable], Iterable],
+                    embed: Callable[[list], np.ndarray], batch_size: int = 256) -> bool:
+        """
+        `sync` for one document given as a stream of paragraphs (strings or
+        (page, paragraph) pairs), so it never has to exist as one string.
+        `split` turns that stream into the indexed paragraphs, lazily. New
+        ones are embedded and appended `batch_size` at a time while the
+        stream is read; paragraphs missing from the stream are removed at the
+        end. The document hash is that of the input paragraphs joined by
+        newlines, as `text_hash` would give for the joined text. Returns
+        whether the index changed.
+
+        A new index is only built once `auto_threshold` paragraphs are
+        buffered (or the stream ends), so the index kind and IVF training see
+        a representative sample rather than the first batch.
+        """
+        document = self.__documents.setdefault(name, {"hash": None, "keys": {}})
+        keys = document["keys"]
+        digest = hashlib.sha256()
+
+        def hashed():
+            for i, item in enumerate(paragraphs):
+                paragraph = item if isinstance(item, str) else item[1]
+                digest.update((f"\n{paragraph}" if i else paragraph).encode("utf-8"))
+                yield item
+
+        seen, new, added = set(), [], 0
+        for item in split(hashed()):
+            paragraph, metadata = (item, None) if isinstance(item, str) else item
+            key = paragraph_key(self.__model_name, paragraph)
+            if key in seen:
+                continue
+            seen.add(key)
+            if key in keys:
+                self.__set_metadata(keys[key], metadata)
+            else:
+                new.append((name, key, paragraph, metadata))
+            if len(new) >= (batch_size if self.__index is not None else max(batch_size, self.__spec.auto_threshold)):
+                self.__append(new, embed)
+                added, new = added + len(new), []
+        if new:
+            self.__append(new, embed)
+            added += len(new)
+
+        stale_ids = [keys.pop(key) for key in [key for key in keys if key not in seen]]
+        if stale_ids:
+            self.__remove(stale_ids)
+        changed = bool(added or stale_ids or self.__metadata.changed) or document["hash"] != digest.hexdigest()
+        document["hash"] = digest.hexdigest()
+
+        self.__update_ranges()
+        tracing.annotate(embedded=added, removed=len(stale_ids), total=len(keys))
+        print(f"Index synced: {added} embedded, {len(stale_ids)} removed, {len(keys)} in {name}.")
+        return changed
+
+    def __writable(self) -> None:
+        """
+        Swap a memory mapped, read-only index for a writable copy.
+        """
+        if self.__mapped:
+            self.__index, self.__mapped = faiss.read_index(self.index_file), False
+            self.__spec.tune(self.__index)
+
+    def __remove(self, stale_ids: list) -> None:
+        """
+        Remove paragraph ids from the index and the paragraph store.
+        """
+        self.__writable()
+        live_ids = np.array([idx for doc in self.__documents.values() for idx in doc["keys"].values()],
+                            dtype="int64")
+        self.__index = self.__spec.remove(self.__index, np.array(stale_ids, dtype="int64"), live_ids)
+        for idx in stale_ids:
+            self.__paragraphs.remove(idx)
+            if idx < len(self.__metadata):
+                self.__metadata.remove(idx)
+        self.__lexical.remove(stale_ids)
+
+    def __append(self, new: list, embed: Callable[[list], np.ndarray]) -> None:
+        """
+        Embed (document name, key, paragraph, metadata) tuples and append
+        them under fresh ids.
+        """
+        self.__writable()
+        embeddings = embed([paragraph for _, _, paragraph, _ in new]).astype("float32")
+        start = len(self.__paragraphs)
+        ids = np.arange(start, start + len(new), dtype="int64")
+        if self.__index is None:
+            self.__index = self.__spec.build(embeddings, ids)
+        else:
+            self.__index.add_with_ids(embeddings, ids)
+        self.__lexical.add(ids, (paragraph for _, _, paragraph, _ in new))
+        for name, key, paragraph, metadata in new:
+            idx = self.__documents[name]["keys"][key] = self.__paragraphs.append(paragraph)
+            self.__set_metadata(idx, metadata)
+
+    def document_of(self, idx: int) -> str:
+        """
+        Name of the document owning paragraph `idx`.
+        """
+        return self.__range_owners[bisect.bisect_right(self.__range_starts, int(idx)) - 1]
+
+    def __selector(self, documents: Iterable[str]):
+        """
+        FAISS id selector covering the paragraphs of `documents`: a range for
+        a single contiguous document, otherwise a batch of ids.
+        """
+        ranges = [r for name in documents for r in self.__ranges.get(name, [])]
+        if len(ranges) == 1:
+            return faiss.IDSelectorRange(*ranges[0])
+        ids = np.concatenate([np.arange(start, end, dtype="int64") for start, end in ranges] or
+                             [np.zeros(0, dtype="int64")])
+        # IDSelectorBatch copies the ids into its own hash set.
+        return faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+
+    @tracing.traced("faiss")
+    def search(self, query_embeddings: np.ndarray, top_k: int, documents: Iterable[str] = None) -> list:
+        """
+        Return (paragraph id, score) pairs of the best matches, optionally
+        restricted to paragraphs of `documents`.
+        """
+        if self.__index is None:
+            return []
+        params = selector = None
+        if documents is not None:
+            # Keep the selector referenced until the search returns.
+            selector = self.__selector(documents)
+            params = self.__spec.search_params(self.__index, selector)
+        scores, indices = self.__index.search(query_embeddings, top_k, params=params)
+        return [(int(idx), float(scores[0, i])) for i, idx in enumerate(indices[0]) if idx >= 0]
+
+    @tracing.traced("bm25")
+    def lexical_search(self, query: str, top_k: int, documents: Iterable[str] = None) -> list:
+        """
+        Return (paragraph id, BM25 score) pairs of the best keyword matches,
+        optionally restricted to paragraphs of `documents`.
+        """
+        ranges = None if documents is None else [r for name in documents for r in self.__ranges.get(name, [])]
+        return self.__lexical.search(query, top_k, ranges)
+
+    def hybrid_search(self, query: str, query_embeddings: np.ndarray, top_k: int, documents: Iterable[str] = None,
+                      depth: int = None, k: int = 60) -> list:
+        """
+        Fuse dense and BM25 results with reciprocal rank fusion. Each list is
+        searched `depth` deep (default: 4 * top_k, at least 20). Scores are
+        fused RRF scores, not cosine similarities.
+        """
+        depth = depth or max(4 * top_k, 20)
+        if documents is not None:
+            documents = list(documents)
+        dense = self.search(query_embeddings, depth, documents)
+        lexical = self.lexical_search(query, depth, documents)
+        return reciprocal_rank_fusion([dense, lexical], top_k, k)
+
+    def query(self, query: str, embed_query: Callable[[str], np.ndarray], top_k: int,
+              documents: Iterable[str] = None, hybrid: bool = True, cache: LRUCache = None) -> list:
+        """
+        (paragraph id, score) pairs for search keywords: `hybrid_search` or a
+        dense `search` of `embed_query(query)`. Queries are normalized (case,
+        whitespace) and results are kept in `cache` per index version, so
+        repeated searches skip the encoder and FAISS.
+        """
+        if self.__index is None:
+            return []
+        query = normalize_query(query)
+        key = (self.__version, query, top_k, tuple(sorted(documents)) if documents is not None else None)
+        results = cache.get(key) if cache is not None else None
+        tracing.annotate(top_k=top_k, hybrid=hybrid, cached=results is not None)
+        if results is None:
+            if hybrid:
+                results = self.hybrid_search(query, embed_query(query), top_k, documents)
+            else:
+                results = self.search(embed_query(query), top_k, documents)
+            if cache is not None:
+                cache.put(key, results)
+        return results
@@ -0,0 +1,111 @@
+import time
+import random
+import asyncio
+import threading
+
+import openai
+
+# Project level imports.
+from utils import tracing
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Rate limits, server errors, timeouts and dropped connections are worth
+    retrying; anything else (bad request, auth) will fail again.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_delay(error: Exception, attempt: int, base: float = 0.5, cap: float = 20.0) -> float:
+    """
+    Seconds to wait before retry `attempt` (0 based): the server's
+    Retry-After if given, otherwise exponential backoff with full jitter.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_retry(fn, *args, retries: int = 5, rate_limiter=None, **kwargs):
+    """
+    Call `fn`, retrying retryable OpenAI errors with backoff. Every attempt,
+    retries included, first takes a token from `rate_limiter` if given.
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire_sync()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            tracing.count("retries")
+            time.sleep(retry_delay(e, attempt))
+
+
+async def acall_with_retry(fn, *args, retries: int = 5, rate_limiter=None, **kwargs):
+    """
+    Await `fn`, retrying retryable OpenAI errors with backoff. Every attempt,
+    retries included, first takes a token from `rate_limiter` if given.
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            tracing.count("retries")
+            await asyncio.sleep(retry_delay(e, attempt))
+
+
+class TokenBucket:
+    """
+    Token bucket limiting requests to `rate` per second with bursts of up to
+    `capacity`. Shared by all coroutines (`acquire`) and threads
+    (`acquire_sync`) using one client.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.__rate = rate
+        self.__capacity = capacity if capacity is not None else max(1.0, rate)
+        self.__tokens = self.__capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __take(self, tokens: float) -> float:
+        """
+        Take `tokens` if available and return 0, else return the seconds to
+        wait before trying again.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+            self.__updated = now
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return 0.0
+            return (tokens - self.__tokens) / self.__rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            wait = self.__take(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: float = 1.0) -> None:
+        while True:
+            wait = self.__take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class CacheMiss(LookupError):
+    """
+    Raised by a read-only cache user when a request was never recorded.
+    """
+
+
+class ResponseCache:
+    """
+    On-disk cache of chat completions in SQLite.
+
+    Entries are keyed by a hash of every request argument (model, messages,
+    stop sequences and sampling parameters), so only byte-identical requests
+    hit. Entries older than `ttl` seconds are ignored and at most
+    `max_entries` are kept, evicting the least recently used.
+
+    The database runs in WAL mode with a busy timeout, so several worker
+    processes can read and write it at once. With `read_only` nothing is
+    written, not even recency, which makes replays deterministic.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_entries: int = None, read_only: bool = False):
+        self.__path = path
+        self.__ttl = ttl
+        self.__max_entries = max_entries
+        self.__read_only = read_only
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if read_only:
+            self.__conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+        else:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.__conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.executescript(self.SCHEMA)
+
+    @property
+    def read_only(self) -> bool:
+        return self.__read_only
+
+    @staticmethod
+    def key(request: dict) -> str:
+        """
+        Hash of a chat completion request's arguments.
+        """
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, request: dict):
+        """
+        Cached value for `request`, or None on a miss.
+        """
+        key = self.key(request)
+        now = time.time()
+        with self.__lock:
+            row = self.__conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.__ttl is not None and now - row[1] > self.__ttl:
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.__read_only:
+                self.__conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, request: dict, value) -> None:
+        """
+        Store `value` (anything JSON serializable) for `request`.
+        """
+        if self.__read_only:
+            return
+        now = time.time()
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (self.key(request), json.dumps(value), now, now),
+            )
+            if self.__ttl is not None:
+                self.__conn.execute("DELETE FROM responses WHERE created < ?", (now - self.__ttl,))
+            if self.__max_entries is not None:
+                excess = self.__conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.__max_entries
+                if excess > 0:
+                    self.__conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,),
+                    )
+
+    def stats(self) -> dict:
+        with self.__lock:
+            entries = self.__conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        self.__conn.close()
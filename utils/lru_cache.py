@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe, in-memory least recently used cache with `maxsize` entries.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.__maxsize = maxsize
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.__lock:
+            if key not in self.__data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.__data.move_to_end(key)
+            return self.__data[key]
+
+    def put(self, key, value) -> None:
+        with self.__lock:
+            self.__data[key] = value
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.__maxsize:
+                self.__data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__data.clear()
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of search keywords used as cache key: lower case with
+    collapsed whitespace. The MiniLM tokenizer is uncased, so this does not
+    change the embedding.
+    """
+    return " ".join(query.split()).lower()
@@ -0,0 +1,111 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+# Project level imports.
+from utils.lru_cache import LRUCache
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent `embed_query` calls into batched forward passes.
+
+    A caller queues its query and waits; a worker thread takes the first
+    waiting query, collects whatever else arrives within `max_wait_ms` (up
+    to `max_batch` queries) and embeds the distinct queries in one call.
+    Under load many single-query passes become a few batched ones; an idle
+    caller pays at most `max_wait_ms`. Everything else (`tokenizer`, `embed`,
+    `max_length`, ...) is the wrapped encoder's, so a MicroBatcher can be
+    given to `EntitySearcher` as its encoder.
+    """
+
+    def __init__(self, encoder, max_batch: int = 64, max_wait_ms: float = 2.0, cache_size: int = 4096):
+        self.__encoder = encoder
+        self.__max_batch = max_batch
+        self.__max_wait = max_wait_ms / 1000
+        self.__cache = LRUCache(cache_size)
+        self.__queue = queue.Queue()
+        self.__worker = None
+        self.__lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__encoder, name)
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, name="micro-batcher", daemon=True)
+                self.__worker.start()
+
+    def __collect(self) -> list:
+        """
+        Block for one request, then gather more until the batch is full or
+        the deadline passes.
+        """
+        batch = [self.__queue.get()]
+        deadline = time.perf_counter() + self.__max_wait
+        while len(batch) < self.__max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def __run(self) -> None:
+        while True:
+            batch = self.__collect()
+            queries = list(dict.fromkeys(query for query, _ in batch))
+            try:
+                embeddings = self.__encoder.embed(queries, len(queries))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            rows = {}
+            for query, embedding in zip(queries, embeddings):
+                row = embedding[None, :]
+                row.setflags(write=False)
+                self.__cache.put(query, row)
+                rows[query] = row
+            for query, future in batch:
+                future.set_result(rows[query])
+
+    def __submit(self, query: str) -> Future:
+        future = Future()
+        embedding = self.__cache.get(query)
+        if embedding is not None:
+            future.set_result(embedding)
+            return future
+        self.__start()
+        self.__queue.put((query, future))
+        return future
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embedding of one query as a read-only (1, dim) array, memoized.
+        """
+        return self.__submit(query).result()
+
+    def embed_queries(self, queries: list) -> np.ndarray:
+        """
+        Embeddings of several queries, batched with those of other callers.
+        """
+        futures = [self.__submit(query) for query in queries]
+        return np.concatenate([future.result() for future in futures]) if futures else np.zeros((0, 0), "float32")
+
+    def clear_cache(self) -> None:
+        self.__cache.clear()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "queries": self.queries,
+                "mean_batch": self.queries / self.batches if self.batches else 0.0}
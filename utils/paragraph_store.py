@@ -0,0 +1,174 @@
+import os
+import sys
+import mmap
+import glob
+import pickle
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+class ParagraphStore:
+    """
+    Paragraph texts stored as one UTF-8 blob plus an int64 offsets array.
+
+    Paragraph `i` is `blob[offsets[i]:offsets[i + 1]]`. Both files are opened
+    with mmap, so worker processes share the page cache instead of each
+    holding an unpickled copy of the corpus, and a lookup only decodes the
+    paragraphs it returns. Removed paragraphs are stored as empty ranges so
+    ids never shift.
+
+    Changes made with `append`/`replace`/`remove` are staged in memory until
+    `save`.
+    """
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__offsets = None
+        self.__file = None
+        self.__blob = b""
+        self.__added = []
+        self.__replaced = {}
+        self.__removed = set()
+        self.__open()
+
+    @property
+    def changed(self) -> bool:
+        """
+        Whether there are staged changes.
+        """
+        return bool(self.__added or self.__replaced or self.__removed)
+
+    @property
+    def offsets_file(self) -> str:
+        return f"{self.__path}.offsets.npy"
+
+    @property
+    def blob_file(self) -> str:
+        return f"{self.__path}.bin"
+
+    def exists(self) -> bool:
+        return os.path.exists(self.offsets_file) and os.path.exists(self.blob_file)
+
+    def __open(self) -> None:
+        if not self.exists():
+            self.__offsets = np.zeros(1, dtype="int64")
+            return
+        self.__offsets = np.load(self.offsets_file, mmap_mode="r")
+        self.__file = open(self.blob_file, "rb")
+        if os.path.getsize(self.blob_file) > 0:
+            self.__blob = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        """
+        Release the mappings and drop staged changes. Mappings must be
+        released before the files are replaced on Windows.
+        """
+        if isinstance(self.__blob, mmap.mmap):
+            self.__blob.close()
+        if self.__file is not None:
+            self.__file.close()
+        self.__offsets, self.__file, self.__blob = np.zeros(1, dtype="int64"), None, b""
+        self.__added, self.__replaced, self.__removed = [], {}, set()
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1 + len(self.__added)
+
+    def __getitem__(self, idx: int) -> Optional[str]:
+        """
+        Return paragraph `idx`, or None if it was removed.
+        """
+        idx = int(idx)
+        if idx in self.__removed:
+            return None
+        if idx in self.__replaced:
+            return self.__replaced[idx]
+        stored = len(self.__offsets) - 1
+        if idx >= stored:
+            return self.__added[idx - stored]
+        start, end = int(self.__offsets[idx]), int(self.__offsets[idx + 1])
+        if start == end:
+            return None
+        return self.__blob[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def append(self, paragraph: str) -> int:
+        """
+        Stage a new paragraph and return its id.
+        """
+        self.__added.append(paragraph)
+        return len(self) - 1
+
+    def replace(self, idx: int, paragraph: str) -> None:
+        """
+        Stage new text for paragraph `idx`, keeping its id.
+        """
+        self.__replaced[int(idx)] = paragraph
+
+    def remove(self, idx: int) -> None:
+        """
+        Stage the removal of paragraph `idx`.
+        """
+        self.__removed.add(int(idx))
+
+    def save(self) -> None:
+        """
+        Rewrite the store with staged changes applied and reopen it.
+        """
+        if not self.changed and self.exists():
+            return
+        self.write(self.__path, iter(self))
+        self.close()
+        os.replace(f"{self.__path}.offsets.tmp.npy", self.offsets_file)
+        os.replace(f"{self.__path}.bin.tmp", self.blob_file)
+        self.__open()
+
+    @staticmethod
+    def write(path: str, paragraphs: Iterable[Optional[str]]) -> None:
+        """
+        Write paragraphs (None for a removed slot) to temporary files next to
+        `path`; `save` moves them in place.
+        """
+        offsets = [0]
+        with open(f"{path}.bin.tmp", "wb") as f:
+            for paragraph in paragraphs:
+                if paragraph:
+                    offsets.append(offsets[-1] + f.write(paragraph.encode("utf-8")))
+                else:
+                    offsets.append(offsets[-1])
+        np.save(f"{path}.offsets.tmp.npy", np.array(offsets, dtype="int64"))
+
+    @classmethod
+    def from_pickle(cls, pickle_path: str, path: str) -> "ParagraphStore":
+        """
+        Convert a pickled paragraph list (`*_paragraphs.pkl`) into a store,
+        keeping list positions as paragraph ids.
+        """
+        with open(pickle_path, "rb") as f:
+            paragraphs = pickle.load(f)
+        store = cls(path)
+        store.close()
+        for paragraph in paragraphs:
+            store.append(paragraph)
+        store.save()
+        return store
+
+
+def convert_index_dir(index_dir: str) -> None:
+    """
+    Convert every `*_paragraphs.pkl` in `index_dir` into the mmap format.
+    """
+    for pickle_path in sorted(glob.glob(os.path.join(index_dir, "*_paragraphs.pkl"))):
+        path = pickle_path[:-len(".pkl")]
+        store = ParagraphStore.from_pickle(pickle_path, path)
+        print(f"Converted {pickle_path}: {len(store)} paragraphs.")
+        store.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    convert_index_dir(sys.argv[1] if len(sys.argv) > 1 else os.environ["INDEX_DIR"])
@@ -0,0 +1,106 @@
+import os
+
+# Project level imports.
+from utils.prompts import instructions, examples
+
+
+class TokenCounter:
+    """
+    Counts tokens with the model's tiktoken encoding.
+
+    tiktoken downloads its encodings on first use; when that is not possible
+    (offline runs) counts fall back to ~4 characters per token, which is close
+    enough for budgeting.
+    """
+
+    def __init__(self, model: str = None):
+        self.__model = model
+        self.__encoding = None
+        self.__loaded = False
+
+    def __load(self) -> None:
+        self.__loaded = True
+        try:
+            import tiktoken
+            try:
+                self.__encoding = tiktoken.encoding_for_model(self.__model or "")
+            except KeyError:
+                self.__encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable ({e.__class__.__name__}), estimating token counts.")
+
+    def count(self, text: str) -> int:
+        if not self.__loaded:
+            self.__load()
+        if self.__encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.__encoding.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut `text` to at most `max_tokens` tokens, marking the cut.
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        if self.__encoding is None:
+            return text[:4 * max_tokens] + " ..."
+        return self.__encoding.decode(self.__encoding.encode(text)[:max_tokens]) + " ..."
+
+
+class PromptBuilder:
+    """
+    Builds the chat messages of one ReAct step.
+
+    The instructions and few-shot examples go into a system message that is
+    byte-identical for every step of every question, so provider side prefix
+    caching can reuse it. The question and the Thought/Action/Observation
+    scratchpad follow in a user message, with long observations truncated and
+    the oldest steps dropped once the scratchpad exceeds its token budget.
+    """
+
+    def __init__(self, n_examples: int = 3, max_observation_tokens: int = 256, max_history_tokens: int = 2000,
+                 model: str = None):
+        """
+        Args:
+            n_examples (int): Few-shot examples to include, None for all of them.
+            max_observation_tokens (int): Tokens kept of each observation.
+            max_history_tokens (int): Token budget of the scratchpad.
+            model (str): Model whose tokenizer counts tokens, defaults to OPENAI_MODEL.
+        """
+        self.__counter = TokenCounter(model or os.getenv("OPENAI_MODEL"))
+        self.__max_observation_tokens = max_observation_tokens
+        self.__max_history_tokens = max_history_tokens
+        self.__system = instructions + "".join(examples[:n_examples])
+
+    @property
+    def counter(self) -> TokenCounter:
+        return self.__counter
+
+    def step(self, iteration: int, thought: str, action: str, observation: str) -> str:
+        """
+        Render one scratchpad step, truncating its observation.
+        """
+        observation = self.__counter.truncate(observation, self.__max_observation_tokens)
+        return f"Thought {iteration}: {thought}\nAction {iteration}: {action}\nObservation {iteration}: {observation}\n"
+
+    def scratchpad(self, question: str, steps: list) -> str:
+        """
+        The question followed by the most recent steps that fit the budget.
+        """
+        kept, used = [], 0
+        for step in reversed(steps):
+            used += self.__counter.count(step)
+            if kept and used > self.__max_history_tokens:
+                break
+            kept.append(step)
+        omitted = "(earlier steps omitted)\n" if len(kept) < len(steps) else ""
+        return f"Question: {question}\n{omitted}" + "".join(reversed(kept))
+
+    def messages(self, question: str, steps: list, tail: str) -> list:
+        """
+        Messages asking for the continuation of `tail`, e.g. "Thought 3:".
+        """
+        return [
+            {"role": "system", "content": self.__system},
+            {"role": "user", "content": self.scratchpad(question, steps) + tail},
+        ]
@@ -90,6 +90,11 @@ Thought 4: The discovery of penicillin by Alexander Fleming in 1928 revolutioniz
 Action 4: Finish[Alexander Fleming, revolutionized medicine by effectively treating bacterial infections.]
 """
 
+# The preamble split into the task instructions and its few-shot examples,
+# so a prompt can carry only some of the examples.
+instructions = instruction_prompt[:instruction_prompt.find("Question:")]
+examples = ["Question: " + example for example in instruction_prompt[len(instructions):].split("Question: ")[1:]]
+
 r = """Question: What are the scientific contributions of Albert Einstein beyond the theory of relativity?
 Thought 1: I need to search for "Albert Einstein scientific contributions" to find details beyond the theory of relativity.
 Action 1: Search[Albert Einstein scientific contributions]
@@ -0,0 +1,297 @@
+"""
+Local embedding and search service shared by many agent processes.
+
+The server owns the encoder and the indexes; concurrent query embeddings
+from all clients are coalesced into micro-batches (see `MicroBatcher`).
+It listens on localhost HTTP or on a Unix socket:
+
+    python -m utils.search_service --port 8765
+    python -m utils.search_service --socket /tmp/search.sock
+
+Agents use it by setting EMBEDDING_SERVER (e.g. "http://127.0.0.1:8765" or
+"unix:///tmp/search.sock") or passing `server=` to `EntitySearcher`.
+
+Requests are JSON POSTs answered with JSON: `/search`, `/embed`, and
+`/prepare`, whose chunked body streams one JSON paragraph (a string or a
+[page, paragraph] pair) per line.
+"""
+import os
+import json
+import stat
+import socket
+import argparse
+import threading
+import http.client
+import socketserver
+from urllib.parse import urlparse, parse_qs, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Union
+
+import numpy as np
+
+# Project level imports.
+from utils.encoder import get_encoder
+from utils.micro_batch import MicroBatcher
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+class SearchService:
+    """
+    One `EntitySearcher` per index, all sharing a micro-batched encoder.
+    They always search locally, even with EMBEDDING_SERVER set in the `.env`
+    the service shares with its clients.
+    """
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", max_batch: int = 64,
+                 max_wait_ms: float = 2.0, hybrid: bool = True, backend: str = None):
+        self.model_name = model_name
+        self.encoder = MicroBatcher(get_encoder(model_name, backend), max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.__hybrid = hybrid
+        self.__searchers = {}
+        self.__index_locks = {}
+        self.__lock = threading.Lock()
+
+    def __index_lock(self, index_path: str) -> threading.Lock:
+        with self.__lock:
+            return self.__index_locks.setdefault(index_path, threading.Lock())
+
+    def searcher(self, index_path: str):
+        """
+        The searcher of a prepared index, loading it from INDEX_DIR if this
+        process has not prepared it. An index that does not exist yet finds
+        nothing, and is looked for again on the next search.
+        """
+        from utils.searcher import EntitySearcher
+        searcher = self.__searchers.get(index_path)
+        if searcher is not None:
+            return searcher
+        with self.__index_lock(index_path):
+            if index_path not in self.__searchers:
+                searcher = EntitySearcher(model_name=self.model_name, index_path=index_path, hybrid=self.__hybrid,
+                                          encoder=self.encoder, server="")
+                if not searcher.load_index():
+                    return searcher
+                self.__searchers[index_path] = searcher
+        return self.__searchers[index_path]
+
+    def prepare(self, index_path: str, paragraphs: Iterable) -> None:
+        """
+        Stream a document's paragraphs into its index. Searches of other
+        indexes go on meanwhile; the index is swapped in once prepared.
+        """
+        from utils.searcher import EntitySearcher
+        with self.__index_lock(index_path):
+            searcher = EntitySearcher(model_name=self.model_name, index_path=index_path, hybrid=self.__hybrid,
+                                      encoder=self.encoder, server="")
+            searcher.prepare_index(paragraphs)
+            self.__searchers[index_path] = searcher
+
+    def search(self, index_path: str, query: str, top_k: int = 3, documents: list = None,
+               metadata: bool = False) -> list:
+        searcher = self.searcher(index_path)
+        if metadata:
+            return searcher.search_chunks(query, top_k, documents)
+        return searcher.search_entity(query, top_k, documents)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def __reply(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __chunked_lines(self) -> Iterable[bytes]:
+        """
+        Lines of a chunked request body, as they arrive.
+        """
+        pending = b""
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the terminating empty line.
+                while self.rfile.readline().strip():
+                    pass
+                break
+            pending += self.rfile.read(size)
+            self.rfile.readline()
+            *lines, pending = pending.split(b"\n")
+            yield from lines
+        if pending:
+            yield pending
+
+    def __paragraphs(self) -> Iterable[Union[str, tuple]]:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            lines = self.__chunked_lines()
+        else:
+            lines = self.rfile.read(int(self.headers.get("Content-Length", 0))).split(b"\n")
+        for line in lines:
+            if line.strip():
+                item = json.loads(line)
+                yield item if isinstance(item, str) else tuple(item)
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        try:
+            if url.path == "/prepare":
+                paragraphs = self.__paragraphs()
+                service.prepare(parse_qs(url.query)["index"][0], paragraphs)
+                # Drain what the searcher did not read, keeping the connection usable.
+                for _ in paragraphs:
+                    pass
+                self.__reply(200, {"ok": True})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if url.path == "/search":
+                results = service.search(request["index"], request["query"], request.get("top_k", 3),
+                                         request.get("documents"), request.get("metadata", False))
+                self.__reply(200, {"results": results})
+            elif url.path == "/embed":
+                self.__reply(200, {"embeddings": service.encoder.embed_queries(request["queries"]).tolist()})
+            elif url.path == "/stats":
+                self.__reply(200, {"model": service.model_name, **service.encoder.stats()})
+            else:
+                self.__reply(404, {"error": f"Unknown endpoint {url.path}."})
+        except Exception as e:
+            # The request body may be partly unread, so do not reuse the connection.
+            self.close_connection = True
+            self.__reply(500, {"error": repr(e)})
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every agent thread keeps a connection of its own open.
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request, ("unix", 0)
+
+
+def serve(service: SearchService, port: int = 8765, socket_path: str = None):
+    """
+    Build the HTTP server of `service`, on localhost `port` or on a Unix
+    socket at `socket_path`; call `serve_forever()` on the result.
+    """
+    if socket_path:
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = _TCPHTTPServer(("127.0.0.1", port), _Handler)
+    server.service = service
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.__socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.__socket_path)
+
+
+class SearchClient:
+    """
+    Client of a `SearchService` at `address`, "http://host:port" or
+    "unix:///path/to/socket". Each thread keeps its own connection alive.
+    """
+
+    def __init__(self, address: str, timeout: float = 300.0):
+        self.address = address
+        self.__url = urlparse(address)
+        self.__timeout = timeout
+        self.__local = threading.local()
+
+    def __connection(self, fresh: bool = False) -> http.client.HTTPConnection:
+        connection = getattr(self.__local, "connection", None)
+        if connection is None or fresh:
+            if connection is not None:
+                connection.close()
+            if self.__url.scheme == "unix":
+                connection = _UnixHTTPConnection(self.__url.path, self.__timeout)
+            else:
+                connection = http.client.HTTPConnection(self.__url.hostname, self.__url.port, timeout=self.__timeout)
+            self.__local.connection = connection
+        return connection
+
+    def __post(self, path: str, body, headers: dict, retry: bool = True) -> dict:
+        try:
+            connection = self.__connection()
+            connection.request("POST", path, body=body, headers=headers)
+            response = connection.getresponse()
+            payload = json.loads(response.read())
+        except (ConnectionError, http.client.HTTPException):
+            # The server closed an idle kept-alive connection; resend once.
+            if not retry:
+                raise
+            self.__connection(fresh=True)
+            return self.__post(path, body, headers, retry=False)
+        if response.status != 200:
+            raise RuntimeError(f"Search service error: {payload.get('error')}")
+        return payload
+
+    def __call(self, path: str, **request) -> dict:
+        return self.__post(path, json.dumps(request).encode("utf-8"), {"Content-Type": "application/json"})
+
+    def search(self, index: str, query: str, top_k: int = 3, documents: list = None, metadata: bool = False) -> list:
+        results = self.__call("/search", index=index, query=query, top_k=top_k, documents=documents,
+                              metadata=metadata)["results"]
+        return [tuple(result) for result in results]
+
+    def embed(self, queries: list) -> np.ndarray:
+        return np.array(self.__call("/embed", queries=queries)["embeddings"], dtype="float32")
+
+    def stats(self) -> dict:
+        return self.__call("/stats")
+
+    def prepare(self, index: str, paragraphs: Iterable[Union[str, tuple]]) -> None:
+        """
+        Stream paragraphs to the service, which indexes them as they arrive.
+        """
+        body = (json.dumps(item).encode("utf-8") + b"\n" for item in paragraphs)
+        self.__post(f"/prepare?index={quote(index)}", body, {"Content-Type": "application/x-ndjson"}, retry=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="listen on this Unix socket instead of localhost:--port")
+    parser.add_argument("--max-batch", type=int, default=64, help="queries embedded per forward pass at most")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="how long a query waits for others")
+    parser.add_argument("--dense", action="store_true", help="dense-only search, without BM25 fusion")
+    parser.add_argument("--backend", help="encoder backend, defaults to ENCODER_BACKEND or torch")
+    args = parser.parse_args()
+
+    service = SearchService(args.model, args.max_batch, args.max_wait_ms, hybrid=not args.dense, backend=args.backend)
+    service.encoder.load()
+    server = serve(service, args.port, args.socket)
+    print(f"Serving {args.model} on {args.socket or f'http://127.0.0.1:{args.port}'}.", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,158 @@
 import os
-import faiss
+from typing import Iterable, Union
+
 import numpy as np
-import torch
-import pickle  # For saving/loading additional data like paragraphs
-from transformers import AutoTokenizer, AutoModel
+
+# Project level imports.
+from utils.encoder import get_encoder
+from utils.index_store import IndexStore
+from utils.ann import IndexSpec
+from utils.chunker import Chunker, split_paragraphs
+from utils.lru_cache import LRUCache
+from utils import tracing
 
 from dotenv import load_dotenv
 load_dotenv()
 
+
 class EntitySearcher:
-    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", index_path="faiss_index"):
-        self.__tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.__model = AutoModel.from_pretrained(model_name)
-        self.__index_path = os.path.join(os.environ["INDEX_DIR"], index_path)
-        self.__paragraphs = []
-        self.__embeddings = []
-        self.__index = None
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", index_path="faiss_index", batch_size=32,
+                 index_spec: IndexSpec = None, cache_size: int = 1024, chunker: Chunker = None, hybrid: bool = True,
+                 encoder=None, server: str = None):
+        """
+        Args:
+            model_name (str): Hugging Face encoder used for paragraphs and queries.
+            index_path (str): Index name inside INDEX_DIR.
+            batch_size (int): Paragraphs embedded per forward pass.
+            index_spec (IndexSpec | str): FAISS index to build, e.g. "flat", "hnsw",
+                "ivf:nlist=1024,nprobe=32". Defaults to "auto".
+            cache_size (int): Search results remembered per index version.
+            chunker (Chunker): How paragraphs are packed into indexed chunks;
+                defaults to `Chunker()`.
+            hybrid (bool): Fuse BM25 keyword matches with the dense results,
+                which finds exact names and dates the encoder misses.
+            encoder: Encoder to use instead of the shared one of `model_name`,
+                e.g. a `MicroBatcher`.
+            server (str): Address of a `utils.search_service` server to
+                delegate indexing and search to, defaults to EMBEDDING_SERVER.
+                The server's model and settings then apply, and no model or
+                index is loaded in this process.
+        """
+        self.__index_path = index_path
+        self.__name = os.path.basename(index_path)
+        server = server if server is not None else os.getenv("EMBEDDING_SERVER")
+        self.__remote = None
+        if server:
+            from utils.search_service import SearchClient
+            self.__remote = SearchClient(server)
+            return
+        # Shared per process and loaded on the first embed, not here.
+        self.__encoder = encoder if encoder is not None else get_encoder(model_name)
+        self.__chunker = chunker if chunker is not None else Chunker(max_tokens=self.__encoder.max_length - 2)
+        self.__store = IndexStore(os.path.join(os.environ["INDEX_DIR"], index_path), model_name, index_spec,
+                                  self.__chunker.signature, getattr(self.__encoder, "backend", "torch"))
+        self.__batch_size = batch_size
+        # Paragraphs of a streamed document embedded and appended at a time.
+        self.__stream_batch_size = 8 * batch_size
+        self.__results = LRUCache(cache_size)
+        self.__hybrid = hybrid
 
-    def __embed_text(self, text: str):
+    def __embed_texts(self, texts: list) -> np.ndarray:
         """
-        Generate embeddings for a given text.
+        Generate embeddings for many texts with the shared encoder.
         """
-        inputs = self.__tokenizer(text, return_tensors="pt", truncation=True, max_length=512, padding="max_length")
-        with torch.no_grad():
-            outputs = self.__model(**inputs)
-            return outputs.last_hidden_state.mean(dim=1).squeeze(0).cpu().numpy()
+        return self.__encoder.embed(texts, self.__batch_size)
 
-    def __save_index(self):
+    def __split(self, document: str) -> list:
         """
-        Save the FAISS index and paragraphs to disk.
+        Chunks of a document text with one paragraph per line.
         """
-        faiss.write_index(self.__index, f"{self.__index_path}.faiss")
-        with open(f"{self.__index_path}_paragraphs.pkl", "wb") as f:
-            pickle.dump(self.__paragraphs, f)
-        print("Index and paragraphs saved.")
+        return self.__chunker.split(document, self.__encoder.tokenizer)
 
-    def __load_index(self) -> bool:
+    def __chunk(self, paragraphs: Iterable) -> Iterable:
         """
-        Load the FAISS index and paragraphs from disk.
+        Chunks of a paragraph stream, produced lazily.
+        """
+        return self.__chunker.chunk(paragraphs, self.__encoder.tokenizer)
+
+    @tracing.traced("prepare_index")
+    def prepare_index(self, document: Union[str, Iterable[str]]) -> None:
         """
-        if os.path.exists(f"{self.__index_path}.faiss") and os.path.exists(f"{self.__index_path}_paragraphs.pkl"):
-            self.__index = faiss.read_index(f"{self.__index_path}.faiss")
-            with open(f"{self.__index_path}_paragraphs.pkl", "rb") as f:
-                self.__paragraphs = pickle.load(f)
+        Prepare the FAISS index by loading it and embedding only the
+        paragraphs that changed since it was built.
+
+        `document` is either the document text or a stream of its paragraphs,
+        e.g. `Document.paragraphs(pages=True)`; a stream is chunked, embedded
+        and indexed batch by batch as it is read. Chunk statistics are
+        printed whenever the index is rebuilt or updated.
+        """
+        if self.__remote is not None:
+            if isinstance(document, str):
+                document = split_paragraphs(document)
+            self.__remote.prepare(self.__index_path, document)
+            return
+        self.__chunker.reset_stats()
+        if not isinstance(document, str):
+            self.__store.load()
+            if self.__store.sync_stream(self.__name, document, self.__chunk, self.__embed_texts,
+                                        self.__stream_batch_size):
+                print(self.__chunker.report())
+                self.__store.save()
+                print("Index and paragraphs saved.")
+            else:
+                print("Index and paragraphs loaded.")
+            return
+
+        if self.__store.load() and self.__store.is_current(self.__name, document):
             print("Index and paragraphs loaded.")
-            return True
-        return False
+            return
 
-    def __process_document(self, document: str) -> None:
+        print("Index missing or stale. Updating it...")
+        self.__store.sync({self.__name: document}, self.__split, self.__embed_texts)
+        print(self.__chunker.report())
+        self.__store.save()
+        print("Index and paragraphs saved.")
+
+    def load_index(self) -> bool:
         """
-        Split the document into paragraphs and create embeddings.
+        Load the index as saved, without checking it against a document. A
+        searcher of a search service has nothing to load: the service loads
+        the index on its first search.
         """
-        self.__paragraphs = [p.strip() for p in document.split("\n") if p.strip()]
-        self.__embeddings = np.array([self.__embed_text(p) for p in self.__paragraphs]).astype("float32")
+        if self.__remote is not None:
+            return True
+        return self.__store.load()
 
-    def __build_index(self) -> None:
+    @tracing.traced("search")
+    def __search_ids(self, query: str, top_k: int, documents: list = None) -> list:
         """
-        Build a FAISS index from paragraph embeddings.
+        (paragraph id, score) pairs for a query, cached; see `IndexStore.query`.
         """
-        self.__index = faiss.IndexFlatL2(self.__embeddings.shape[1])
-        self.__index.add(self.__embeddings)
+        return self.__store.query(query, self.__encoder.embed_query, top_k, documents, self.__hybrid, self.__results)
 
-    def prepare_index(self, document: str) -> None:
+    def search_entity(self, query: str, top_k: int = 3, documents: list = None) -> list:
         """
-        Prepare the FAISS index by loading it or creating it if necessary.
+        Search for the top matching paragraph(s) for a given query, returned
+        as (paragraph, score) pairs, best first. The score is the cosine
+        similarity, or the reciprocal rank fusion score when hybrid.
+        `documents` restricts results to paragraphs of those document names,
+        as in `CorpusSearcher`. An EntitySearcher holds a single document,
+        named after the base name of its `index_path`; a list without that
+        name finds nothing.
         """
-        if not self.__load_index():
-            print("No existing index found. Creating a new one...")
-            self.__process_document(document)
-            self.__build_index()
-            self.__save_index()
+        if self.__remote is not None:
+            return self.__remote.search(self.__index_path, query, top_k, documents)
+        return [(self.__store.paragraphs[idx], score) for idx, score in self.__search_ids(query, top_k, documents)]
 
-    def search_entity(self, query: str, top_k: int = 3) -> list:
+    def search_chunks(self, query: str, top_k: int = 3, documents: list = None) -> list:
         """
-        Search for the top matching paragraph(s) for a given query.
+        Same as `search_entity`, with the chunk's metadata (page, end_page,
+        heading, tokens) as a third element.
         """
-        query_embedding = self.__embed_text(query).reshape(1, -1).astype("float32")
-        distances, indices = self.__index.search(query_embedding, top_k)
-        results = [(self.__paragraphs[idx], distances[0, i]) for i, idx in enumerate(indices[0]) if idx < len(self.__paragraphs)]
-        return results
+        if self.__remote is not None:
+            return self.__remote.search(self.__index_path, query, top_k, documents, metadata=True)
+        return [(self.__store.paragraphs[idx], score, self.__store.metadata(idx))
+                for idx, score in self.__search_ids(query, top_k, documents)]
 
 # Example Usage
 if __name__ == "__main__":
@@ -104,5 +178,5 @@ if __name__ == "__main__":
 
     # Output results
     print("Top Matching Paragraph(s):")
-    for text, distance in results:
-        print(f"\nParagraph: {text}\nDistance: {distance}")
\ No newline at end of file
+    for text, score in results:
+        print(f"\nParagraph: {text}\nScore: {score}")
\ No newline at end of file
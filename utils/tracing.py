@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import secrets
+import inspect
+import functools
+import threading
+import contextvars
+from typing import Iterable, List
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+# Span attributes added up across a batch in `format_summary`.
+TOTALS = ("iterations", "llm_calls", "cache_hits", "retries", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+_sinks = []
+_current = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """
+    A timed operation. Spans opened while another is current become its
+    children and share its trace id; the finished span is sent to every sink
+    as a dict with `name`, `trace_id`, `span_id`, `parent_id`, `start`
+    (epoch seconds), `duration_ms` and `attrs`.
+    """
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.attrs[name] = self.attrs.get(name, 0) + n
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(8)
+        self.span_id = secrets.token_hex(8)
+        self.__token = _current.set(self)
+        self.__start = time.time()
+        self.__perf = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.__perf
+        _current.reset(self.__token)
+        if exc is not None:
+            self.attrs["error"] = repr(exc)
+        record = {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "start": self.__start, "duration_ms": duration * 1000, "attrs": self.attrs,
+        }
+        for sink in list(_sinks):
+            sink.emit(record)
+
+
+class _NoopSpan:
+    """
+    Returned by `span` while no sink is installed.
+    """
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def enabled() -> bool:
+    return bool(_sinks)
+
+
+def add_sink(sink) -> None:
+    _sinks.append(sink)
+
+
+def remove_sink(sink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def span(name: str, **attrs):
+    """
+    Context manager timing the enclosed block as span `name`. Without sinks
+    this is a shared no-op object, so instrumentation costs a list check.
+    """
+    if not _sinks:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name: str):
+    """
+    Decorator running each call of a function or coroutine in span `name`.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _sinks:
+                    return await fn(*args, **kwargs)
+                with Span(name, {}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attrs) -> None:
+    """
+    Set attributes on the current span, if any.
+    """
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+    Add `n` to counter attribute `name` of the current span, if any.
+    """
+    current = _current.get()
+    if current is not None:
+        current.count(name, n)
+
+
+class JsonlSink:
+    """
+    Appends one JSON line per span to `path`.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__file = open(path, "a", buffering=1)
+        self.__lock = threading.Lock()
+
+    def emit(self, record: dict) -> None:
+        line = json.dumps(record, default=str)
+        with self.__lock:
+            self.__file.write(line + "\n")
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class MemorySink:
+    """
+    Keeps spans in `spans`, e.g. to summarize a batch or inspect in tests.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def emit(self, record: dict) -> None:
+        self.spans.append(record)
+
+
+class OTelSink:
+    """
+    Re-emits finished spans through OpenTelemetry (`opentelemetry-api`, with
+    an SDK and exporter configured by the application). Spans keep their
+    timing; parent links are exported as `trace_id`/`parent_id` attributes
+    since the parent span has not ended when its children are emitted.
+    """
+
+    def __init__(self, tracer_name: str = "agentqa"):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OTelSink needs the opentelemetry-api package.") from e
+        self.__tracer = trace.get_tracer(tracer_name)
+
+    def emit(self, record: dict) -> None:
+        start = int(record["start"] * 1e9)
+        attributes = {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+                      for key, value in record["attrs"].items() if value is not None}
+        attributes.update({"trace_id": record["trace_id"], "span_id": record["span_id"],
+                           "parent_id": record["parent_id"] or ""})
+        otel_span = self.__tracer.start_span(record["name"], start_time=start, attributes=attributes)
+        otel_span.end(end_time=start + int(record["duration_ms"] * 1e6))
+
+
+def read_jsonl(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: Iterable[dict]) -> dict:
+    """
+    Per span name: count, p50/p95/mean/total milliseconds; plus the sum of
+    the `TOTALS` attributes over all spans.
+    """
+    durations, totals = {}, dict.fromkeys(TOTALS, 0)
+    for record in spans:
+        durations.setdefault(record["name"], []).append(record["duration_ms"])
+        for key in TOTALS:
+            value = record["attrs"].get(key)
+            if isinstance(value, (int, float)):
+                totals[key] += value
+    stages = {}
+    for name, values in durations.items():
+        values = np.array(values)
+        p50, p95 = np.percentile(values, [50, 95])
+        stages[name] = {"count": len(values), "p50_ms": float(p50), "p95_ms": float(p95),
+                        "mean_ms": float(values.mean()), "total_ms": float(values.sum())}
+    return {"stages": stages, "totals": totals}
+
+
+def format_summary(spans: Iterable[dict]) -> str:
+    summary = summarize(spans)
+    lines = [f"{'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'total ms':>10}"]
+    for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(f"{name:<16} {stage['count']:>6} {stage['p50_ms']:>9.1f} {stage['p95_ms']:>9.1f} "
+                     f"{stage['total_ms']:>10.1f}")
+    lines.append(", ".join(f"{key}: {value}" for key, value in summary["totals"].items()))
+    return "\n".join(lines)
+
+
+if os.getenv("TRACE_PATH"):
+    add_sink(JsonlSink(os.environ["TRACE_PATH"]))
+if os.getenv("TRACE_OTEL", "").strip().lower() in ("1", "true", "yes"):
+    add_sink(OTelSink())
+
+
+if __name__ == "__main__":
+    print(format_summary(read_jsonl(sys.argv[1] if len(sys.argv) > 1 else os.environ["TRACE_PATH"])))